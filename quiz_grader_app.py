@@ -1,20 +1,1919 @@
 #!/usr/bin/env python3
+import time
+
+_PROCESS_START = time.perf_counter()
+
+import argparse
+import bisect
 import csv
+import enum
+import getpass
+import hashlib
 import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import shutil
+import sys
+import threading
+import urllib.parse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, simpledialog, filedialog
+
+# PyMuPDF and Pillow are imported on first use; importing them up front dominated cold start.
+fitz = None
+Image = None
+ImageTk = None
+PDF_EMBED_AVAILABLE = None
+_PDF_IMPORT_LOCK = threading.Lock()
+
+BLANK_INK_RATIO = 0.002
+DUPLICATE_HASH_SIZE = 16
+INK_GRID = (64, 80)
+INK_LEVEL = 224
+FINGERPRINT_VERSION = 3
+STARTUP_TARGET_MS = 1000
+STAGE_DEFAULT_MB = 2048
+LMS_BATCH_SIZE = 50
+LMS_MAX_RPS = 5.0
+HISTORY_MAX_BYTES = 4 * 1024 * 1024
+
+
+def _ensure_pdf_libs():
+    global fitz, Image, ImageTk, PDF_EMBED_AVAILABLE
+    with _PDF_IMPORT_LOCK:
+        if PDF_EMBED_AVAILABLE is None:
+            try:
+                import fitz as fitz_module  # PyMuPDF
+                from PIL import Image as image_module, ImageTk as imagetk_module
+
+                fitz, Image, ImageTk = fitz_module, image_module, imagetk_module
+                PDF_EMBED_AVAILABLE = True
+            except Exception:
+                PDF_EMBED_AVAILABLE = False
+    return PDF_EMBED_AVAILABLE
+
+
+def _file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RecordStatus(enum.IntEnum):
+    UNGRADED = 0
+    GRADED = 1
+    MISSING = 2
+
+
+_STATUS_NAMES = [s.name.lower() for s in RecordStatus]
+_STATUS_CODES = {name: RecordStatus(i) for i, name in enumerate(_STATUS_NAMES)}
+
+
+class RubricRegistry:
+    # Rubric name -> bit. Bits are never reused, so removing or re-adding a rubric leaves other records intact.
+    def __init__(self, names=()):
+        self.bits = {}
+        self.names = []
+        self.decoded = {}
+        for name in names:
+            self.bit(name)
+        self.set_order(self.names)
+
+    def bit(self, name):
+        b = self.bits.get(name)
+        if b is None:
+            b = self.bits[name] = len(self.names)
+            self.names.append(name)
+        return b
+
+    def set_order(self, names):
+        # Decoded selections follow the rubric list, not the order bits were handed out in.
+        self.order = {self.bit(name): i for i, name in enumerate(names)}
+        self.decoded = {}
+
+    def encode(self, names):
+        mask = 0
+        for name in names or ():
+            mask |= 1 << self.bit(name)
+        return mask
+
+    def names_for(self, mask):
+        # A class shares a handful of distinct selections, so decoded masks are memoized.
+        names = self.decoded.get(mask)
+        if names is None:
+            found = []
+            i, rest = 0, mask
+            while rest:
+                if rest & 1:
+                    found.append(i)
+                rest >>= 1
+                i += 1
+            last = len(self.order)
+            found.sort(key=lambda b: (self.order.get(b, last), b))
+            names = self.decoded[mask] = tuple(self.names[b] for b in found)
+        return names
+
+    def decode(self, mask):
+        return list(self.names_for(mask))
+
+    def rename(self, old, new):
+        if new in self.bits or old not in self.bits:
+            return False
+        b = self.bits.pop(old)
+        self.bits[new] = b
+        self.names[b] = new
+        self.decoded = {}
+        return True
+
+
+class Student:
+    __slots__ = ("netid", "first", "last", "email", "section", "submission")
+
+    def __init__(self, netid, first="", last="", email="", section="", submission=None):
+        self.netid = netid
+        self.first = first
+        self.last = last
+        self.email = email
+        self.section = section
+        self.submission = submission
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def keys(self):
+        return self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def copy(self, **changes):
+        student = Student(self.netid, self.first, self.last, self.email, self.section, self.submission)
+        for key, value in changes.items():
+            student[key] = value
+        return student
+
+
+class GradeRecord:
+    # Dict-compatible view over a slotted record: selections are a bitset over the quiz's RubricRegistry,
+    # status is a RecordStatus. to_dict() yields the same JSON shape as the plain dict records.
+    FIELDS = (
+        "selected_rubrics",
+        "extra_deduction",
+        "comments",
+        "graded",
+        "status",
+        "score",
+        "total_deduction",
+        "graded_at",
+        "updated_at",
+        "grader",
+    )
+    __slots__ = (
+        "registry",
+        "rubrics",
+        "extra_deduction",
+        "comments",
+        "graded",
+        "status_code",
+        "score",
+        "total_deduction",
+        "graded_at",
+        "updated_at",
+        "grader",
+        "extra",
+    )
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.rubrics = 0
+        self.extra_deduction = 0.0
+        self.comments = ""
+        self.graded = False
+        self.status_code = RecordStatus.UNGRADED
+        self.score = None
+        self.total_deduction = 0.0
+        self.graded_at = None
+        self.updated_at = None
+        self.grader = ""
+        self.extra = None
+
+    @classmethod
+    def from_dict(cls, data, registry):
+        rec = cls(registry)
+        for key, value in data.items():
+            rec[key] = value
+        return rec
+
+    def __getitem__(self, key):
+        if key == "selected_rubrics":
+            return self.registry.decode(self.rubrics)
+        if key == "status":
+            return _STATUS_NAMES[self.status_code]
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == "selected_rubrics":
+            if isinstance(value, str):
+                raise TypeError("selected_rubrics must be a collection of rubric names, not a string")
+            self.rubrics = self.registry.encode(value)
+        elif key == "status":
+            self.status_code = _STATUS_CODES.get(value, RecordStatus.UNGRADED)
+        elif key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.FIELDS or bool(self.extra and key in self.extra)
+
+    def get(self, key, default=None):
+        if key == "status":
+            return _STATUS_NAMES[self.status_code]
+        if key == "selected_rubrics":
+            return list(self.registry.names_for(self.rubrics))
+        if key in _RECORD_FIELDS:
+            return getattr(self, key)
+        return self.extra.get(key, default) if self.extra else default
+
+    def keys(self):
+        return list(self.FIELDS) + list(self.extra or ())
 
-try:
-    import fitz  # PyMuPDF
-    from PIL import Image, ImageTk
+    def __iter__(self):
+        return iter(self.keys())
 
-    PDF_EMBED_AVAILABLE = True
-except Exception:
-    fitz = None
-    Image = None
-    ImageTk = None
-    PDF_EMBED_AVAILABLE = False
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def has_rubric(self, name):
+        b = self.registry.bits.get(name)
+        return b is not None and bool(self.rubrics >> b & 1)
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+_RECORD_FIELDS = frozenset(GradeRecord.FIELDS)
+
+
+def _record_fields(rec):
+    # (status, rubric names, score). GradeRecords are read from their slots; plain dicts come from state files.
+    if type(rec) is GradeRecord:
+        return _STATUS_NAMES[rec.status_code], rec.registry.names_for(rec.rubrics), rec.score
+    return rec.get("status", "ungraded"), tuple(rec.get("selected_rubrics", []) or ()), rec.get("score")
+
+
+def read_roster(roster_path):
+    students = []
+    with Path(roster_path).open(newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if (row.get("Role", "") or "").strip() != "Student":
+                continue
+            netid = (row.get("Net ID", "") or "").strip().lower()
+            if not netid:
+                continue
+            students.append(
+                Student(
+                    netid,
+                    first=(row.get("First Name", "") or "").strip(),
+                    last=(row.get("Last Name", "") or "").strip(),
+                    email=(row.get("Email", "") or "").strip(),
+                    section=(row.get("Section", "") or "").strip(),
+                )
+            )
+    students.sort(key=lambda s: (s.last.lower(), s.first.lower(), s.netid))
+    return students
+
+
+def read_state(state_path):
+    state_path = Path(state_path)
+    if not state_path.exists():
+        return {}
+    try:
+        with state_path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def match_submissions(students, submissions_dir, manual_mappings):
+    submissions_dir = Path(submissions_dir)
+    student_by_netid = {s["netid"]: s for s in students}
+    submissions = {}
+    pdf_paths = sorted(submissions_dir.glob("*.pdf"))
+    by_stem = {p.stem.lower(): p for p in pdf_paths}
+    # One directory listing answers every existence check; each stat is a round trip on network shares.
+    listed = {p.name for p in pdf_paths}
+
+    for netid, student in student_by_netid.items():
+        if netid in by_stem:
+            student["submission"] = str(by_stem[netid])
+            submissions[netid] = str(by_stem[netid])
+
+    for filename, mapped_netid in manual_mappings.items():
+        mapped_netid = (mapped_netid or "").strip().lower()
+        if mapped_netid in student_by_netid:
+            path = submissions_dir / filename
+            if filename in listed:
+                student_by_netid[mapped_netid]["submission"] = str(path)
+                submissions[mapped_netid] = str(path)
+
+    unmatched = []
+    for p in pdf_paths:
+        if p.stem.lower() not in student_by_netid and p.name not in manual_mappings:
+            unmatched.append(p.name)
+    return submissions, unmatched
+
+
+def _read_json_cache(path):
+    try:
+        with Path(path).open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _write_json_cache(path, data):
+    # Per-writer temp name: two background jobs saving the same cache must not share a half-written file.
+    tmp = Path(f"{path}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+_ROSTER_CACHE = {}
+_ROSTER_CACHE_LOCK = threading.Lock()
+
+
+def _path_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+class SubmissionCache:
+    # Local copies of submissions, keyed by source path and checked against the source's size/mtime.
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.manifest_path = self.cache_dir / "manifest.json"
+        self.lock = threading.Lock()
+        self.entries = _read_json_cache(self.manifest_path)
+        for entry in self.entries.values():
+            entry["valid"] = False
+
+    def _local(self, src):
+        return self.cache_dir / (hashlib.sha1(src.encode("utf-8")).hexdigest()[:20] + ".pdf")
+
+    def lookup(self, src):
+        with self.lock:
+            entry = self.entries.get(src)
+            if entry is None or not entry.get("valid"):
+                return None
+            entry["used"] = time.time()
+        local = self._local(src)
+        return str(local) if local.exists() else None
+
+    def _evict(self, keep, needed):
+        total = sum(e["sig"][0] for e in self.entries.values())
+        for src, entry in sorted(self.entries.items(), key=lambda kv: kv[1].get("used", 0.0)):
+            if total + needed <= self.max_bytes:
+                break
+            if src in keep:
+                continue
+            try:
+                self._local(src).unlink(missing_ok=True)
+            except OSError:
+                continue
+            del self.entries[src]
+            total -= entry["sig"][0]
+        return total + needed <= self.max_bytes
+
+    def stage(self, paths, progress=None):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            for entry in self.entries.values():
+                entry["valid"] = False
+        copied = 0
+        keep = set()
+        budget = 0
+        for i, src in enumerate(paths, 1):
+            sig = _path_signature(src)
+            if sig is None:
+                continue
+            budget += sig[0]
+            if budget > self.max_bytes:
+                break
+            keep.add(src)
+            with self.lock:
+                entry = self.entries.get(src)
+                fresh = entry is not None and entry["sig"] == sig and self._local(src).exists()
+                if fresh:
+                    entry["valid"] = True
+                elif not self._evict(keep, sig[0]):
+                    break
+            if not fresh:
+                local = self._local(src)
+                tmp = local.with_name(f"{local.name}.{threading.get_ident()}.tmp")
+                try:
+                    shutil.copyfile(src, tmp)
+                    os.replace(tmp, local)
+                except OSError:
+                    continue
+                with self.lock:
+                    self.entries[src] = {"sig": sig, "used": 0.0, "valid": True}
+                copied += 1
+            if progress:
+                progress(i, len(paths))
+        with self.lock:
+            _write_json_cache(self.manifest_path, self.entries)
+        return len(keep), copied
+
+
+def read_roster_cached(roster_path):
+    key = str(Path(roster_path).resolve())
+    sig = _path_signature(key)
+    with _ROSTER_CACHE_LOCK:
+        cached = _ROSTER_CACHE.get(key)
+        if cached is None or cached[0] != sig:
+            cached = (sig, read_roster(key))
+            _ROSTER_CACHE[key] = cached
+    # Callers attach submissions to students, so hand out copies of the cached parse.
+    return [s.copy(submission=None) for s in cached[1]]
+
+
+def load_workspace(base_dir):
+    data = _read_json_cache(Path(base_dir) / "workspace.json")
+    quizzes = [q for q in data.get("quizzes", []) or [] if isinstance(q, dict) and q.get("name")]
+    if not quizzes:
+        quizzes = [{"name": "Quiz1", "submissions": "Quiz1", "dir": "."}]
+    return {"roster": data.get("roster", "roster.csv"), "quizzes": quizzes}
+
+
+def save_workspace(base_dir, workspace):
+    path = Path(base_dir) / "workspace.json"
+    tmp = Path(str(path) + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(workspace, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _quiz_score_text(status, score):
+    if status == "missing":
+        return "0"
+    if status != "graded" or score is None:
+        return ""
+    return _fmt_number(float(score))
+
+
+def write_combined_gradebook(students, quiz_names, in_memory, state_paths, out_path, progress=None):
+    columns = {}
+    for name in quiz_names:
+        if name in in_memory:
+            columns[name] = in_memory[name]
+            continue
+        grades = read_state(state_paths[name]).get("grades", {}) or {}
+        columns[name] = {
+            netid: _quiz_score_text(rec.get("status"), rec.get("score"))
+            for netid, rec in grades.items()
+            if isinstance(rec, dict)
+        }
+        del grades
+
+    out_path = Path(out_path)
+    tmp = Path(str(out_path) + ".tmp")
+    with tmp.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Net ID", "First Name", "Last Name", "Email"] + list(quiz_names) + ["Total"])
+        for i, (netid, first, last, email) in enumerate(students, 1):
+            scores = [columns[name].get(netid, "") for name in quiz_names]
+            total = sum(float(x) for x in scores if x != "")
+            writer.writerow([netid, first, last, email] + scores + [_fmt_number(total)])
+            if progress and (i % 200 == 0 or i == len(students)):
+                progress(i, len(students))
+    os.replace(tmp, out_path)
+    return len(students)
+
+
+def lms_grade_rows(students, grades, lms_key):
+    # Same key and grade text as the LMS import CSV.
+    rows = {}
+    for s in students:
+        rec = grades.get(s["netid"]) or {}
+        key = s["email"] if lms_key == "Email" else s["netid"]
+        if key:
+            rows[key] = {"id": key, "grade": _quiz_score_text(rec.get("status"), rec.get("score"))}
+    return rows
+
+
+def _lms_row_version(row):
+    return hashlib.sha1(json.dumps(row, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class LmsClient:
+    # One keep-alive connection reused for every batch, paced to max_rps, retrying 429/5xx and dropped sockets.
+    def __init__(self, url, token=None, max_rps=LMS_MAX_RPS, retries=4, timeout=15):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Unsupported LMS endpoint: {url}")
+        self.parts = parts
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.token = token
+        self.min_interval = 1.0 / max_rps if max_rps > 0 else 0.0
+        self.retries = retries
+        self.timeout = timeout
+        self.conn = None
+        self.last_request = 0.0
+        self.requests = 0
+
+    def _connection(self):
+        import http.client
+
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.parts.scheme == "https" else http.client.HTTPConnection
+            self.conn = cls(self.parts.hostname, self.parts.port, timeout=self.timeout)
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _pace(self):
+        wait = self.last_request + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.last_request = time.monotonic()
+
+    def post(self, payload):
+        import http.client
+
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        delay = 0.5
+        for attempt in range(self.retries + 1):
+            self._pace()
+            self.requests += 1
+            try:
+                conn = self._connection()
+                conn.request("POST", self.path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (OSError, http.client.HTTPException) as exc:
+                self.close()
+                error = f"{type(exc).__name__}: {exc}"
+            else:
+                if resp.status < 300:
+                    return json.loads(data or b"{}")
+                error = f"HTTP {resp.status}"
+                if resp.status != 429 and resp.status < 500:
+                    raise RuntimeError(f"LMS rejected batch: {error} {data[:200]!r}")
+                retry_after = resp.getheader("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            if attempt < self.retries:
+                time.sleep(delay)
+                delay *= 2
+        raise RuntimeError(f"LMS sync failed after {self.retries + 1} attempts: {error}")
+
+
+def sync_lms_grades(client, rows, sync_state, batch_size=LMS_BATCH_SIZE, progress=None):
+    # sync_state["synced"] maps LMS key -> version of the row last accepted by the endpoint.
+    synced = sync_state.setdefault("synced", {})
+    changed = sorted(key for key, row in rows.items() if synced.get(key) != _lms_row_version(row))
+    for i in range(0, len(changed), batch_size):
+        batch = changed[i : i + batch_size]
+        client.post({"grades": [rows[key] for key in batch]})
+        for key in batch:
+            synced[key] = _lms_row_version(rows[key])
+        if progress:
+            progress(min(i + batch_size, len(changed)), len(changed))
+    return len(changed)
+
+
+def load_lms_sync_state(path, url):
+    state = _read_json_cache(path)
+    if state.get("endpoint") != url:
+        # A different endpoint has never seen these grades.
+        state = {"endpoint": url, "synced": {}}
+    return state
+
+
+def _mock_lms_handler():
+    # http.server pulls in the email package; only the mock server pays for it.
+    import http.server
+
+    class MockLmsHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with self.server.lock:
+                self._reply(200, {"grades": self.server.grades, "requests": self.server.requests})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            with self.server.lock:
+                self.server.requests += 1
+                if self.server.rng.random() < self.server.fail_rate:
+                    self._reply(self.server.rng.choice([429, 503]), {"error": "try again"})
+                    return
+                try:
+                    grades = json.loads(body or b"{}")["grades"]
+                except (ValueError, KeyError):
+                    self._reply(400, {"error": "expected {\"grades\": [...]}"})
+                    return
+                for row in grades:
+                    self.server.grades[row["id"]] = row["grade"]
+            self._reply(200, {"accepted": len(grades)})
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return MockLmsHandler
+
+
+def serve_mock_lms(port, fail_rate=0.0):
+    import http.server
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), _mock_lms_handler())
+    server.lock = threading.Lock()
+    server.grades = {}
+    server.requests = 0
+    server.fail_rate = fail_rate
+    server.rng = random.Random(0)
+    return server
+
+
+def shard_state(state, students, graders):
+    grades = state.get("grades", {}) or {}
+    eligible = [s["netid"] for s in students if s.get("submission")]
+    shared = {k: v for k, v in state.items() if k not in ("grades", "assignment")}
+    shards = {}
+    for i, grader in enumerate(graders):
+        lo = len(eligible) * i // len(graders)
+        hi = len(eligible) * (i + 1) // len(graders)
+        netids = eligible[lo:hi]
+        shard = dict(shared)
+        shard["assignment"] = {"grader": grader, "netids": netids, "created_at": time.time()}
+        shard["grades"] = {n: grades[n] for n in netids if n in grades}
+        shards[grader] = shard
+    return shards
+
+
+def _record_rank(rec):
+    return (float(rec.get("updated_at") or 0.0), rec.get("grader") or "")
+
+
+def _rename_key(r):
+    return (float(r.get("at") or 0.0), r.get("old", ""), r.get("new", ""))
+
+
+def _resolve_renames(renames, sources=None, known=None):
+    # Names are tracked per input file: a rename the file already applied means any later use of the old
+    # name there is a new rubric, while files that never saw the rename still mean the renamed one.
+    sources = sources or {}
+    known = known or {}
+    views = {label: {} for label in known}
+    final = {}
+    origin = {}
+    conflicts = []
+
+    def identity(view, name):
+        return view.get(name, ("base", name))
+
+    for r in sorted(renames, key=_rename_key):
+        old, new = r.get("old"), r.get("new")
+        if not old or not new or old == new:
+            continue
+        key = _rename_key(r)
+        label = sources.get(key, "?")
+        target = identity(views.get(label, {}), old)
+        current = final.get(target, target[1])
+        if current not in (old, new):
+            # Another input already renamed `old`; the later rename wins and the earlier name folds into it.
+            conflicts.append(
+                f"rubric '{old}' renamed to '{current}' in {origin.get(target, '?')} and to '{new}' in {label}; using '{new}'"
+            )
+        final[target] = new
+        origin[target] = label
+        for name, view in views.items():
+            if key in known[name]:
+                view[new] = identity(view, old)
+                view[old] = ("new", old, key)
+
+    def resolver(label):
+        view = views.get(label, {})
+
+        def resolve(name):
+            target = identity(view, name)
+            return final.get(target, target[1])
+
+        return resolve
+
+    return resolver, conflicts
+
+
+def merge_states(paths):
+    # Only one input state is held in memory at a time; the merged result grows by record.
+    full_score = None
+    items = []
+    renames = []
+    rename_sources = {}
+    known = {}
+    mappings = {}
+    grades = {}
+    sources = {}
+    conflicts = []
+
+    for path in sorted(paths, key=str):
+        state = read_state(path)
+        label = Path(path).name
+        if state.get("full_score") is not None:
+            if full_score is None:
+                full_score = float(state["full_score"])
+            elif float(state["full_score"]) != full_score:
+                conflicts.append(f"full_score {_fmt_number(float(state['full_score']))} in {label}; kept {_fmt_number(full_score)}")
+        known[label] = set()
+        for r in state.get("rubric_renames", []) or []:
+            # Shards inherit the renames made before sharding; keep one copy of each.
+            if not isinstance(r, dict):
+                continue
+            known[label].add(_rename_key(r))
+            if _rename_key(r) not in rename_sources:
+                rename_sources[_rename_key(r)] = label
+                renames.append(r)
+        for item in state.get("rubric_items", []) or []:
+            items.append((label, dict(item)))
+        for filename, netid in (state.get("manual_mappings", {}) or {}).items():
+            if filename in mappings and mappings[filename] != netid:
+                conflicts.append(f"mapping {filename}: {mappings[filename]} vs {netid} in {label}; kept {mappings[filename]}")
+            else:
+                mappings.setdefault(filename, netid)
+        for netid, rec in (state.get("grades", {}) or {}).items():
+            if not isinstance(rec, dict):
+                continue
+            current = grades.get(netid)
+            if current is None:
+                grades[netid] = rec
+                sources[netid] = label
+                continue
+            if current == rec:
+                continue
+            if current.get("updated_at") and rec.get("updated_at"):
+                conflicts.append(
+                    f"{netid}: edited in {sources[netid]} by {current.get('grader') or '?'} "
+                    f"and in {label} by {rec.get('grader') or '?'}; kept the latest"
+                )
+            if _record_rank(rec) > _record_rank(current):
+                grades[netid] = rec
+                sources[netid] = label
+        del state
+
+    resolver, rename_conflicts = _resolve_renames(renames, rename_sources, known)
+    conflicts.extend(rename_conflicts)
+    rubric_items = []
+    by_name = {}
+    for label, item in items:
+        item["name"] = resolver(label)((item.get("name", "") or "").strip())
+        existing = by_name.get(item["name"])
+        if existing is None:
+            by_name[item["name"]] = item
+            rubric_items.append(item)
+            continue
+        if float(existing.get("points", 0)) != float(item.get("points", 0)):
+            conflicts.append(f"rubric '{item['name']}' points differ in {label}; kept the most recently edited")
+        if float(item.get("updated_at") or 0) > float(existing.get("updated_at") or 0):
+            existing.update(item)
+
+    full_score = 10.0 if full_score is None else full_score
+    points = {i["name"]: float(i.get("points", 0)) for i in rubric_items}
+    resolvers = {label: resolver(label) for label in known}
+    for netid, rec in grades.items():
+        resolve = resolvers[sources[netid]]
+        selected = []
+        for name in rec.get("selected_rubrics", []) or []:
+            name = resolve(name)
+            if name in points and name not in selected:
+                selected.append(name)
+        rec["selected_rubrics"] = selected
+        if rec.get("status") == "graded":
+            extra = float(rec.get("extra_deduction") or 0.0)
+            rec["total_deduction"] = sum(points[n] for n in selected) + extra
+            rec["score"] = max(0.0, full_score - rec["total_deduction"])
+
+    merged = {
+        "full_score": full_score,
+        "rubric_items": rubric_items,
+        "manual_mappings": mappings,
+        "grades": grades,
+        "rubric_renames": renames,
+    }
+    return merged, conflicts
+
+
+def _cached_file_sha1(path, file_hashes):
+    st = os.stat(path)
+    known = file_hashes.get(path)
+    if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+        return known[2]
+    digest = _file_sha1(path)
+    file_hashes[path] = [st.st_size, st.st_mtime_ns, digest]
+    return digest
+
+
+def _process_pool(max_workers=None):
+    # Spawned workers avoid forking a process that already holds a Tk interpreter.
+    workers = max_workers or os.cpu_count() or 1
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _process_pool_map(worker, tasks, progress=None, max_workers=None, pool=None):
+    tasks = list(tasks)
+    results = []
+    if not tasks:
+        return results
+    if len(tasks) == 1 or max_workers == 1:
+        for i, task in enumerate(tasks, 1):
+            results.append(worker(task))
+            if progress:
+                progress(i, len(tasks))
+        return results
+    workers = max_workers or os.cpu_count() or 1
+    if pool is None:
+        with _process_pool(workers) as pool:
+            return _process_pool_map(worker, tasks, progress=progress, max_workers=workers, pool=pool)
+    chunksize = max(1, len(tasks) // (workers * 4))
+    for i, result in enumerate(pool.map(worker, tasks, chunksize=chunksize), 1):
+        results.append(result)
+        if progress:
+            progress(i, len(tasks))
+    return results
+
+
+def _dhash(img, size=8):
+    # Difference hash: size rows of size + 1 pixels -> size * size bits comparing horizontal neighbours.
+    small = list(img.resize((size + 1, size), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            i = row * (size + 1) + col
+            bits = (bits << 1) | (1 if small[i] > small[i + 1] else 0)
+    return f"{bits:0{size * size // 4}x}"
+
+
+def _gray_stats(samples, width, height):
+    img = Image.frombytes("L", (width, height), samples)
+    hist = img.histogram()
+    ink = sum(hist[:128]) / max(1, width * height)
+    return ink, _dhash(img)
+
+
+def _gray_fingerprint(samples, width, height):
+    ink, dhash = _gray_stats(samples, width, height)
+    if ink < BLANK_INK_RATIO:
+        return {"kind": "blank", "value": ""}
+    return {"kind": "hash", "value": dhash}
+
+
+def _scan_page_stats(task):
+    path, start, end = task
+    _ensure_pdf_libs()
+    doc = fitz.open(path)
+    try:
+        stats = []
+        for i in range(start, end):
+            pix = doc.load_page(i).get_pixmap(matrix=fitz.Matrix(0.25, 0.25), colorspace=fitz.csGRAY, alpha=False)
+            stats.append(_gray_stats(pix.samples, pix.width, pix.height))
+        return stats
+    finally:
+        doc.close()
+
+
+def _split_ranges(page_count, mode, pages_per=None, stats=None, cover_distance=10):
+    if mode == "fixed":
+        return [(i, min(i + pages_per, page_count) - 1) for i in range(0, page_count, pages_per)]
+    ranges = []
+    start = None
+    for i, (ink, dhash) in enumerate(stats):
+        if mode == "blank":
+            # Blank separator sheets are dropped; runs of inked pages become submissions.
+            if ink < BLANK_INK_RATIO:
+                if start is not None:
+                    ranges.append((start, i - 1))
+                start = None
+            elif start is None:
+                start = i
+        else:
+            # Cover mode: every page that looks like the scan's first page starts a new submission.
+            if start is None:
+                start = i
+            elif _hamming(dhash, stats[0][1]) <= cover_distance:
+                ranges.append((start, i - 1))
+                start = i
+    if start is not None:
+        ranges.append((start, len(stats) - 1))
+    return ranges
+
+
+def _write_page_range(task):
+    source, first, last, out_path = task
+    _ensure_pdf_libs()
+    tmp = out_path + ".tmp"
+    src = fitz.open(source)
+    out = fitz.open()
+    try:
+        out.insert_pdf(src, from_page=first, to_page=last)
+        out.save(tmp, garbage=3, deflate=True)
+    finally:
+        out.close()
+        src.close()
+    # Never replace a PDF that may already be matched or mapped to a student.
+    if os.path.exists(out_path):
+        os.remove(tmp)
+        raise FileExistsError(f"{out_path} already exists")
+    os.replace(tmp, out_path)
+    return os.path.basename(out_path)
+
+
+def _split_prefix(out_dir, stem, count, width):
+    # Copiers reuse names like Scan.pdf; pick the first prefix none of whose outputs exist yet.
+    prefix = stem
+    n = 1
+    while any((out_dir / f"{prefix}_{i:0{width}d}.pdf").exists() for i in range(1, count + 1)):
+        n += 1
+        prefix = f"{stem}-{n}"
+    return prefix
+
+
+def split_scan(scan_path, out_dir, mode="fixed", pages_per=None, progress=None):
+    _ensure_pdf_libs()
+    scan_path = Path(scan_path)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    doc = fitz.open(str(scan_path))
+    page_count = len(doc)
+    doc.close()
+
+    stats = None
+    if mode != "fixed":
+        chunk = 25
+        tasks = [(str(scan_path), i, min(i + chunk, page_count)) for i in range(0, page_count, chunk)]
+        stats = [st for part in _process_pool_map(_scan_page_stats, tasks, progress=progress) for st in part]
+    ranges = _split_ranges(page_count, mode, pages_per=pages_per, stats=stats)
+
+    width = max(3, len(str(len(ranges))))
+    prefix = _split_prefix(out_dir, scan_path.stem, len(ranges), width)
+    tasks = [
+        (str(scan_path), first, last, str(out_dir / f"{prefix}_{n:0{width}d}.pdf"))
+        for n, (first, last) in enumerate(ranges, 1)
+    ]
+    return _process_pool_map(_write_page_range, tasks, progress=progress), prefix
+
+
+def _ink_map(img):
+    # One bit per grid cell, row-major from the top-left: set where the cell holds noticeable ink.
+    width, height = INK_GRID
+    bits = 0
+    for value in img.resize((width, height), Image.BOX).getdata():
+        bits = (bits << 1) | (1 if value < INK_LEVEL else 0)
+    return f"{bits:0{width * height // 4}x}"
+
+
+def _submission_fingerprint(path):
+    # pages: a 16x16 dHash per page to find candidates cheaply; ink: a coarse ink map per page, used to
+    # confirm candidates on the ink that is not part of the shared quiz template.
+    try:
+        result = {"sha1": _file_sha1(path), "pages": [], "ink": [], "version": FINGERPRINT_VERSION}
+    except OSError as exc:
+        return {"error": str(exc.strerror or exc)}
+    if not _ensure_pdf_libs():
+        return result
+    try:
+        doc = fitz.open(path)
+    except Exception:
+        return result
+    try:
+        for page in doc:
+            pix = page.get_pixmap(matrix=fitz.Matrix(0.5, 0.5), colorspace=fitz.csGRAY, alpha=False)
+            img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+            result["pages"].append(_dhash(img, DUPLICATE_HASH_SIZE))
+            result["ink"].append(_ink_map(img))
+    except Exception:
+        result["pages"] = []
+        result["ink"] = []
+    finally:
+        doc.close()
+    return result
+
+
+def fingerprint_submissions(paths, cache, progress=None, pool=None, sources=None):
+    todo = []
+    for path in paths:
+        entry = cache.get(path)
+        if not entry or entry.get("sig") != _path_signature(path) or entry.get("version") != FINGERPRINT_VERSION:
+            todo.append(path)
+    sources = sources or {}
+    tasks = [sources.get(p, p) for p in todo]
+    for path, fp in zip(todo, _process_pool_map(_submission_fingerprint, tasks, progress=progress, pool=pool)):
+        # Files that vanish or cannot be read mid-scan are left out (the file check reports them) and retried.
+        if "error" in fp:
+            cache.pop(path, None)
+            continue
+        fp["sig"] = _path_signature(path)
+        cache[path] = fp
+    return {path: cache[path] for path in paths if path in cache}
+
+
+def _page_text_words(path):
+    if not _ensure_pdf_libs():
+        return []
+    try:
+        doc = fitz.open(path)
+    except Exception:
+        return []
+    try:
+        return [sorted(_comment_words(page.get_text("text"))) for page in doc]
+    except Exception:
+        return []
+    finally:
+        doc.close()
+
+
+def index_submission_text(paths, index, progress=None, pool=None, sources=None):
+    for path in list(index.files):
+        if path not in paths:
+            index.remove(path)
+    todo = [p for p in paths if index.files.get(p, {}).get("sig") != _path_signature(p)]
+    sources = sources or {}
+    tasks = [sources.get(p, p) for p in todo]
+    for path, pages in zip(todo, _process_pool_map(_page_text_words, tasks, progress=progress, pool=pool)):
+        index.add(path, _path_signature(path), pages)
+    return len(todo)
+
+
+def _check_submission(path):
+    try:
+        with open(path, "rb") as f:
+            head = f.read(1024)
+    except OSError as exc:
+        return {"problem": f"unreadable: {exc.strerror or exc}", "pages": 0, "deep": True}
+    if not head:
+        return {"problem": "empty file", "pages": 0, "deep": True}
+    if b"%PDF-" not in head:
+        return {"problem": "not a PDF (no %PDF header)", "pages": 0, "deep": True}
+    if not _ensure_pdf_libs():
+        return {"problem": None, "pages": 0, "deep": False}
+    try:
+        doc = fitz.open(path)
+    except Exception as exc:
+        return {"problem": f"corrupt: {exc}", "pages": 0, "deep": True}
+    try:
+        if doc.needs_pass:
+            return {"problem": "encrypted (password required)", "pages": 0, "deep": True}
+        pages = len(doc)
+        if pages == 0:
+            return {"problem": "no pages", "pages": 0, "deep": True}
+        try:
+            doc.load_page(0).get_pixmap(matrix=fitz.Matrix(0.1, 0.1), colorspace=fitz.csGRAY, alpha=False)
+        except Exception as exc:
+            return {"problem": f"page 1 does not render: {exc}", "pages": pages, "deep": True}
+        return {"problem": None, "pages": pages, "deep": True}
+    finally:
+        doc.close()
+
+
+def check_submissions(paths, cache, progress=None, pool=None, sources=None):
+    deep = bool(_ensure_pdf_libs())
+    todo = []
+    for path in paths:
+        entry = cache.get(path)
+        if not entry or entry.get("sig") != _path_signature(path) or (deep and not entry.get("deep")):
+            todo.append(path)
+    sources = sources or {}
+    tasks = [sources.get(p, p) for p in todo]
+    for path, result in zip(todo, _process_pool_map(_check_submission, tasks, progress=progress, pool=pool)):
+        result["sig"] = _path_signature(path)
+        cache[path] = result
+    for path in list(cache):
+        if path not in paths:
+            del cache[path]
+    return {path: cache[path]["problem"] for path in paths if cache[path]["problem"]}
+
+
+def _dilate_ink(bits):
+    # Grow each inked cell into its 4 neighbours so a scan shifted by a cell still lines up with the template.
+    width, height = INK_GRID
+    total = width * height
+    full = (1 << total) - 1
+    first_col = sum(1 << (total - 1 - k) for k in range(0, total, width))
+    last_col = sum(1 << (total - 1 - k) for k in range(width - 1, total, width))
+    left = (bits << 1) & ~last_col
+    right = (bits >> 1) & ~first_col
+    return (bits | left | right | (bits << width) | (bits >> width)) & full
+
+
+def _ink_templates(fingerprints):
+    # Cells inked in at least half of the submissions with the same page count are the printed template.
+    width, height = INK_GRID
+    total = width * height
+    groups = {}
+    for fp in fingerprints.values():
+        if fp.get("ink") and len(fp["ink"]) == len(fp["pages"]):
+            groups.setdefault(len(fp["ink"]), []).append(fp["ink"])
+    templates = {}
+    for page_count, inks in groups.items():
+        if len(inks) < 3:
+            templates[page_count] = [0] * page_count
+            continue
+        pages = []
+        for page in range(page_count):
+            counts = [0] * total
+            for ink in inks:
+                for k, bit in enumerate(bin(int(ink[page], 16))[2:].zfill(total)):
+                    if bit == "1":
+                        counts[k] += 1
+            mask = 0
+            for count in counts:
+                mask = (mask << 1) | (1 if count * 2 >= len(inks) else 0)
+            pages.append(_dilate_ink(mask))
+        templates[page_count] = pages
+    return templates
+
+
+def _same_answers(answers_a, answers_b, max_ink_diff=0.25, min_ink=20):
+    # Compare only the ink students added; two filled-in copies of a template differ here, copies do not.
+    differ = union = 0
+    for a, b in zip(answers_a, answers_b):
+        differ += (a ^ b).bit_count()
+        union += (a | b).bit_count()
+    return union >= min_ink and differ <= max_ink_diff * union
+
+
+def find_duplicate_submissions(fingerprints, max_distance=6):
+    groups = []
+    by_sha = {}
+    for path, fp in sorted(fingerprints.items()):
+        by_sha.setdefault(fp["sha1"], []).append(path)
+    for paths in by_sha.values():
+        if len(paths) > 1:
+            groups.append({"kind": "exact", "paths": paths})
+
+    # Near-duplicate candidates: same page count and every page within max_distance of 256 bits. Splitting
+    # the first page hash into max_distance + 1 bands means any pair within range shares at least one band
+    # exactly, so candidates are found without comparing every pair.
+    representatives = {paths[0]: fingerprints[paths[0]] for paths in by_sha.values()}
+    bands = {}
+    for path, fp in sorted(representatives.items()):
+        if fp["pages"]:
+            first = fp["pages"][0]
+            width = len(first) // (max_distance + 1)
+            for b in range(max_distance + 1):
+                bands.setdefault((len(fp["pages"]), b, first[b * width : (b + 1) * width]), []).append(path)
+    parent = {}
+
+    def find(x):
+        while parent.get(x, x) != x:
+            x = parent[x]
+        return x
+
+    # A whole-page hash cannot tell two students on the same template apart, so every candidate is confirmed
+    # on its answer ink; fingerprints without ink maps (no PDF renderer) are never called near duplicates.
+    templates = _ink_templates(representatives)
+    answers = {}
+    for path, fp in representatives.items():
+        template = templates.get(len(fp["pages"]))
+        if template and len(fp.get("ink", [])) == len(template):
+            answers[path] = [int(ink, 16) & ~mask for ink, mask in zip(fp["ink"], template)]
+    seen = set()
+    for bucket in bands.values():
+        for i, a in enumerate(bucket):
+            for b in bucket[i + 1 :]:
+                if (a, b) in seen:
+                    continue
+                seen.add((a, b))
+                fp_a, fp_b = representatives[a], representatives[b]
+                if not all(_hamming(x, y) <= max_distance for x, y in zip(fp_a["pages"], fp_b["pages"])):
+                    continue
+                if a in answers and b in answers and _same_answers(answers[a], answers[b]):
+                    parent[find(b)] = find(a)
+    clusters = {}
+    for path in parent:
+        clusters.setdefault(find(path), set()).add(path)
+    for root, members in clusters.items():
+        members.add(root)
+        groups.append({"kind": "near", "paths": sorted(members)})
+    return groups
+
+
+def _answer_fingerprint(task):
+    path, page_index, top, bottom = task
+    _ensure_pdf_libs()
+    try:
+        doc = fitz.open(path)
+    except Exception as exc:
+        return {"kind": "error", "value": str(exc)}
+    try:
+        if page_index >= len(doc):
+            return {"kind": "nopage", "value": ""}
+        page = doc.load_page(page_index)
+        r = page.rect
+        clip = fitz.Rect(r.x0, r.y0 + r.height * top, r.x1, r.y0 + r.height * bottom)
+        text = " ".join(page.get_text("text", clip=clip).split()).lower()
+        if text:
+            return {"kind": "text", "value": text}
+        pix = page.get_pixmap(matrix=fitz.Matrix(0.5, 0.5), clip=clip, colorspace=fitz.csGRAY, alpha=False)
+        return _gray_fingerprint(pix.samples, pix.width, pix.height)
+    finally:
+        doc.close()
+
+
+def _hamming(a_hex, b_hex):
+    return bin(int(a_hex, 16) ^ int(b_hex, 16)).count("1")
+
+
+def _cluster_answer_fingerprints(fingerprints, max_distance=6):
+    exact = {}
+    hashed = []
+    for netid, fp in sorted(fingerprints.items()):
+        if fp.get("kind") == "hash":
+            for cluster in hashed:
+                if _hamming(cluster["value"], fp["value"]) <= max_distance:
+                    cluster["members"].append(netid)
+                    break
+            else:
+                hashed.append({"kind": "hash", "value": fp["value"], "members": [netid]})
+        else:
+            key = (fp.get("kind", "error"), fp.get("value", ""))
+            exact.setdefault(key, {"kind": key[0], "value": key[1], "members": []})["members"].append(netid)
+    clusters = list(exact.values()) + hashed
+    clusters.sort(key=lambda c: (-len(c["members"]), c["kind"], c["members"][0]))
+    return clusters
+
+
+def _fmt_number(x):
+    if abs(x - int(x)) < 1e-9:
+        return str(int(x))
+    return f"{x:.2f}"
+
+
+def _feedback_lines(student, rec, rubric_points, full_score):
+    lines = [
+        f"{student['last']}, {student['first']} ({student['netid']})",
+        f"Submission: {os.path.basename(student['submission'])}",
+        "",
+        f"Score: {_fmt_number(float(rec.get('score') or 0.0))} / {_fmt_number(full_score)}",
+        "",
+        "Deductions:",
+    ]
+    selected = rec.get("selected_rubrics", []) or []
+    for name in selected:
+        lines.append(f"  -{_fmt_number(rubric_points.get(name, 0.0))}  {name}")
+    try:
+        extra = float(rec.get("extra_deduction", 0.0))
+    except Exception:
+        extra = 0.0
+    if extra:
+        lines.append(f"  -{_fmt_number(extra)}  Extra deduction")
+    if not selected and not extra:
+        lines.append("  (none)")
+    comments = (rec.get("comments", "") or "").strip()
+    if comments:
+        lines += ["", "Comments:", comments]
+    return lines
+
+
+def _write_feedback_pdf(task):
+    # Returns None on success or a message; one bad submission must not abort the whole batch.
+    source, out_path, lines = task
+    tmp = out_path + ".tmp"
+    try:
+        _build_feedback_pdf(source, tmp, lines)
+        os.replace(tmp, out_path)
+    except Exception as exc:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return str(exc) or type(exc).__name__
+    return None
+
+
+def _feedback_font(text):
+    # Base-14 helv has no glyphs past Latin-1, so names in other scripts printed as "?".
+    # Noto Sans (pymupdf-fonts) covers Latin, Greek and Cyrillic; the built-in CJK fallback covers the rest.
+    best = None
+    for name in ("notos", "cjk"):
+        try:
+            font = fitz.Font(name)
+        except Exception:
+            continue
+        if all(font.has_glyph(ord(c)) for c in text if not c.isspace()):
+            return font
+        best = best or font
+    return fitz.Font("cjk") if best is None else best
+
+
+def _fit_lines(page, rect, lines, fontsize):
+    # Largest prefix of lines that fits rect. insert_textbox writes nothing and returns < 0 on overflow,
+    # so trials on a scratch page are safe; a successful trial only scribbles on the scratch page.
+    def fits(count):
+        return page.insert_textbox(rect, "\n".join(lines[:count]), fontsize=fontsize, fontname="feedback") >= 0
+
+    if fits(len(lines)):
+        return len(lines)
+    lo, hi = 0, len(lines) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if fits(mid):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _build_feedback_pdf(source, tmp, lines):
+    _ensure_pdf_libs()
+    text_lines = "\n".join(lines).split("\n")
+    font = _feedback_font("".join(text_lines))
+    out = fitz.open()
+    scratch = fitz.open()
+    try:
+        margin = 54
+        trial = scratch.new_page()
+        trial.insert_font(fontname="feedback", fontbuffer=font.buffer)
+        rect = fitz.Rect(margin, margin, trial.rect.width - margin, trial.rect.height - margin)
+        # Long comments continue on further cover pages; a single line too long for a page at the smallest
+        # size is a failure rather than the blank page insert_textbox would leave.
+        while text_lines:
+            for fontsize in (11, 9, 7):
+                count = _fit_lines(trial, rect, text_lines, fontsize)
+                if count:
+                    break
+            else:
+                raise ValueError("feedback text does not fit on a page")
+            page = out.new_page()
+            page.insert_font(fontname="feedback", fontbuffer=font.buffer)
+            if page.insert_textbox(rect, "\n".join(text_lines[:count]), fontsize=fontsize, fontname="feedback") < 0:
+                raise ValueError("feedback text does not fit on a page")
+            text_lines = text_lines[count:]
+        src = fitz.open(source)
+        try:
+            out.insert_pdf(src)
+        finally:
+            src.close()
+        out.save(tmp, garbage=3, deflate=True)
+    finally:
+        scratch.close()
+        out.close()
+
+
+def generate_feedback_pdfs(students, state, out_dir, progress=None):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / "manifest.json"
+    manifest = _read_json_cache(manifest_path)
+    entries = manifest.get("students", {})
+    file_hashes = manifest.get("files", {})
+
+    grades = state.get("grades", {}) or {}
+    rubric_points = {}
+    for item in state.get("rubric_items", []) or []:
+        try:
+            rubric_points[(item.get("name", "") or "").strip()] = float(item.get("points", 0.0))
+        except Exception:
+            rubric_points[(item.get("name", "") or "").strip()] = 0.0
+    try:
+        full_score = float(state.get("full_score", 10.0))
+    except Exception:
+        full_score = 10.0
+
+    tasks = []
+    pending = {}
+    failed = {}
+    skipped = 0
+    for student in students:
+        rec = grades.get(student["netid"])
+        if not student.get("submission") or not isinstance(rec, dict) or rec.get("status") != "graded":
+            continue
+        lines = _feedback_lines(student, rec, rubric_points, full_score)
+        record_digest = hashlib.sha1(json.dumps(lines).encode("utf-8")).hexdigest()
+        try:
+            source_digest = _cached_file_sha1(student["submission"], file_hashes)
+        except OSError as exc:
+            failed[student["netid"]] = f"unreadable: {exc.strerror or exc}"
+            continue
+        out_path = out_dir / f"{student['netid']}_feedback.pdf"
+        key = [record_digest, source_digest]
+        if entries.get(student["netid"]) == key and out_path.exists():
+            skipped += 1
+            continue
+        tasks.append((student["submission"], str(out_path), lines))
+        pending[student["netid"]] = key
+
+    written = 0
+    errors = _process_pool_map(_write_feedback_pdf, tasks, progress=progress)
+    for (netid, key), error in zip(pending.items(), errors):
+        if error:
+            failed[netid] = error
+        else:
+            entries[netid] = key
+            written += 1
+    _write_json_cache(manifest_path, {"students": entries, "files": file_hashes})
+    return written, skipped, failed
+
+
+def _comment_words(text):
+    return set(re.findall(r"\w+", (text or "").lower()))
+
+
+class GradeIndex:
+    def __init__(self):
+        self.by_status = {}
+        self.by_rubric = {}
+        self.by_gram = {}
+        self.scores = []
+        self.entries = {}
+
+    def clear(self):
+        self.__init__()
+
+    def update(self, netid, rec):
+        self.remove(netid)
+        if rec is None:
+            return
+        status, rubrics, score = _record_fields(rec)
+        rubrics = frozenset(rubrics)
+        score = None if score is None else float(score)
+        text = (rec.get("comments", "") or "").lower()
+        self.entries[netid] = (status, rubrics, score, text)
+        self.by_status.setdefault(status, set()).add(netid)
+        for name in rubrics:
+            self.by_rubric.setdefault(name, set()).add(netid)
+        for gram in _trigrams(text):
+            self.by_gram.setdefault(gram, set()).add(netid)
+        if score is not None:
+            bisect.insort(self.scores, (score, netid))
+
+    def remove(self, netid):
+        entry = self.entries.pop(netid, None)
+        if entry is None:
+            return
+        status, rubrics, score, text = entry
+        self.by_status.get(status, set()).discard(netid)
+        for name in rubrics:
+            self.by_rubric.get(name, set()).discard(netid)
+        for gram in _trigrams(text):
+            bucket = self.by_gram.get(gram)
+            if bucket is not None:
+                bucket.discard(netid)
+                if not bucket:
+                    del self.by_gram[gram]
+        if score is not None:
+            i = bisect.bisect_left(self.scores, (score, netid))
+            if i < len(self.scores) and self.scores[i] == (score, netid):
+                del self.scores[i]
+
+    def rename_rubric(self, old, new):
+        members = self.by_rubric.pop(old, set())
+        self.by_rubric.setdefault(new, set()).update(members)
+        for netid in members:
+            status, rubrics, score, text = self.entries[netid]
+            self.entries[netid] = (status, (rubrics - {old}) | {new}, score, text)
+
+    def drop_rubric(self, name):
+        for netid in self.by_rubric.pop(name, set()):
+            status, rubrics, score, text = self.entries[netid]
+            self.entries[netid] = (status, rubrics - {name}, score, text)
+
+    def query(self, status=None, has_all=(), has_none=(), min_score=None, max_score=None, comment=None):
+        result = None
+
+        def narrow(current, candidates):
+            return set(candidates) if current is None else current & candidates
+
+        if status:
+            result = narrow(result, self.by_status.get(status, set()))
+        for name in has_all:
+            result = narrow(result, self.by_rubric.get(name, set()))
+        if min_score is not None or max_score is not None:
+            lo = 0 if min_score is None else bisect.bisect_left(self.scores, (float(min_score), ""))
+            hi = len(self.scores) if max_score is None else bisect.bisect_right(self.scores, (float(max_score), "\uffff"))
+            result = narrow(result, {netid for _, netid in self.scores[lo:hi]})
+        if comment:
+            # Every trigram inside a query word must occur in the comment; the substring check then confirms
+            # the match, so "rect" finds "incorrect" without scanning the whole vocabulary.
+            needle = comment.lower()
+            for word in needle.split():
+                for i in range(len(word) - 2):
+                    result = narrow(result, self.by_gram.get(word[i : i + 3], set()))
+            candidates = self.entries if result is None else result
+            result = {netid for netid in candidates if needle in self.entries[netid][3]}
+        if result is None:
+            result = set(self.entries)
+        for name in has_none:
+            result -= self.by_rubric.get(name, set())
+        return result
+
+
+class GradeStats:
+    def __init__(self):
+        self.rubric_counts = {}
+        self.histogram = {}
+        self.section_scores = {}
+        self.section_sums = {}
+        self.graded_per_hour = {}
+        self.status_counts = {}
+        self.entries = {}
+
+    def clear(self):
+        self.__init__()
+
+    def _bump(self, counts, key, delta):
+        counts[key] = counts.get(key, 0) + delta
+        if counts[key] <= 0:
+            del counts[key]
+
+    def update(self, netid, rec, section=""):
+        self.remove(netid)
+        if rec is None:
+            return
+        status, rubrics, score = _record_fields(rec)
+        if status != "graded":
+            rubrics, score = (), None
+        score = None if score is None else float(score)
+        hour = None
+        if status == "graded" and rec.get("graded_at"):
+            hour = time.strftime("%Y-%m-%d %H:00", time.localtime(float(rec["graded_at"])))
+        entry = (status, rubrics, score, section or "", hour)
+        self.entries[netid] = entry
+        self._apply(entry, 1)
+
+    def remove(self, netid):
+        entry = self.entries.pop(netid, None)
+        if entry is not None:
+            self._apply(entry, -1)
+
+    def _apply(self, entry, delta):
+        status, rubrics, score, section, hour = entry
+        self._bump(self.status_counts, status, delta)
+        for name in rubrics:
+            self._bump(self.rubric_counts, name, delta)
+        if hour is not None:
+            self._bump(self.graded_per_hour, hour, delta)
+        if score is None:
+            return
+        self._bump(self.histogram, int(score), delta)
+        scores = self.section_scores.setdefault(section, [])
+        self.section_sums[section] = self.section_sums.get(section, 0.0) + delta * score
+        if delta > 0:
+            bisect.insort(scores, score)
+        else:
+            del scores[bisect.bisect_left(scores, score)]
+            if not scores:
+                del self.section_scores[section]
+                del self.section_sums[section]
+
+    def rename_rubric(self, old, new):
+        if old in self.rubric_counts:
+            self.rubric_counts[new] = self.rubric_counts.get(new, 0) + self.rubric_counts.pop(old)
+        for netid, (status, rubrics, score, section, hour) in list(self.entries.items()):
+            if old in rubrics:
+                self.entries[netid] = (status, tuple(new if r == old else r for r in rubrics), score, section, hour)
+
+    def drop_rubric(self, name):
+        self.rubric_counts.pop(name, None)
+        for netid, (status, rubrics, score, section, hour) in list(self.entries.items()):
+            if name in rubrics:
+                self.entries[netid] = (status, tuple(r for r in rubrics if r != name), score, section, hour)
+
+    def report_lines(self, rubric_names):
+        graded = self.status_counts.get("graded", 0)
+        lines = [
+            "Status: " + ", ".join(f"{k} {v}" for k, v in sorted(self.status_counts.items())),
+            "",
+            "Rubric item frequency (graded):",
+        ]
+        for name in rubric_names:
+            count = self.rubric_counts.get(name, 0)
+            pct = 100.0 * count / graded if graded else 0.0
+            lines.append(f"  {count:5d}  {pct:5.1f}%  {name}")
+        lines += ["", "Score histogram (graded):"]
+        peak = max(self.histogram.values(), default=0)
+        for bucket in sorted(self.histogram):
+            count = self.histogram[bucket]
+            bar = "#" * max(1, round(30 * count / peak))
+            lines.append(f"  {bucket:>4}  {count:5d}  {bar}")
+        lines += ["", "Per section (graded):"]
+        for section in sorted(self.section_scores):
+            scores = self.section_scores[section]
+            n = len(scores)
+            mid = n // 2
+            median = scores[mid] if n % 2 else (scores[mid - 1] + scores[mid]) / 2
+            mean = self.section_sums[section] / n
+            lines.append(f"  {section or '(none)'}: n={n}  mean={mean:.2f}  median={median:.2f}")
+        lines += ["", "Graded per hour:"]
+        for hour in sorted(self.graded_per_hour):
+            lines.append(f"  {hour}  {self.graded_per_hour[hour]}")
+        return lines
+
+
+def _record_snapshot(rec):
+    return {k: (list(v) if isinstance(v, list) else v) for k, v in rec.items()}
+
+
+def _record_diff(before, after):
+    keys = [k for k in set(before) | set(after) if before.get(k) != after.get(k)]
+    return {k: before.get(k) for k in keys}, {k: after.get(k) for k in keys}
+
+
+class UndoHistory:
+    def __init__(self, limit=200):
+        self.limit = limit
+        self.undo_stack = deque(maxlen=limit)
+        self.redo_stack = []
+        self.open_key = None
+        self.dirty = False
+
+    def push(self, op, merge_key=None):
+        self.redo_stack = []
+        self.dirty = True
+        top = self.undo_stack[-1] if self.undo_stack else None
+        if merge_key is not None and merge_key == self.open_key and top is not None and top["op"] == "records":
+            # Keystroke autosaves on one student fold into a single entry until navigation seals it.
+            for netid, (before, after) in op["changes"].items():
+                old_before, old_after = top["changes"].get(netid, ({}, {}))
+                merged_before = dict(before)
+                merged_before.update(old_before)
+                merged_after = dict(old_after)
+                merged_after.update(after)
+                keys = [k for k in merged_before if merged_before[k] != merged_after.get(k)]
+                top["changes"][netid] = ({k: merged_before[k] for k in keys}, {k: merged_after[k] for k in keys})
+            top["changes"] = {n: pair for n, pair in top["changes"].items() if pair[0]}
+            if not top["changes"]:
+                self.undo_stack.pop()
+                self.open_key = None
+            return
+        self.undo_stack.append(op)
+        self.open_key = merge_key
+
+    def seal(self):
+        self.open_key = None
+
+    def pop_undo(self):
+        self.seal()
+        if not self.undo_stack:
+            return None
+        op = self.undo_stack.pop()
+        self.redo_stack.append(op)
+        self.dirty = True
+        return op
+
+    def pop_redo(self):
+        self.seal()
+        if not self.redo_stack:
+            return None
+        op = self.redo_stack.pop()
+        self.undo_stack.append(op)
+        self.dirty = True
+        return op
+
+    def trim(self, max_bytes=HISTORY_MAX_BYTES):
+        # The op cap alone does not bound the file: one bulk apply snapshots every record it touched.
+        # Oldest entries go first; the newest undo step is always kept.
+        budget = max_bytes
+        keep = 0
+        for op in reversed(self.undo_stack):
+            budget -= len(json.dumps(op))
+            if budget < 0 and keep:
+                break
+            keep += 1
+        while len(self.undo_stack) > keep:
+            self.undo_stack.popleft()
+        keep = 0
+        for op in reversed(self.redo_stack):
+            budget -= len(json.dumps(op))
+            if budget < 0:
+                break
+            keep += 1
+        self.redo_stack = self.redo_stack[len(self.redo_stack) - keep :]
+
+    def to_dict(self):
+        self.trim()
+        return {"limit": self.limit, "undo": list(self.undo_stack), "redo": self.redo_stack[-self.limit :]}
+
+    @classmethod
+    def from_dict(cls, data, limit=200):
+        history = cls(limit=data.get("limit", limit) if isinstance(data, dict) else limit)
+        if isinstance(data, dict):
+            history.undo_stack.extend(data.get("undo", []) or [])
+            history.redo_stack = list(data.get("redo", []) or [])
+        return history
+
+
+def _trigrams(text):
+    grams = set()
+    for word in text.split():
+        word = f" {word} "
+        grams.update(word[i : i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+class StudentSearchIndex:
+    MAX_PREFIX = 16
+    FIELD_WEIGHTS = (("netid", 50), ("last", 30), ("first", 20), ("email", 10))
+
+    def __init__(self):
+        self.prefixes = {}
+        self.trigrams = {}
+        self.entries = {}
+
+    def _tokens(self, student):
+        tokens = []
+        for field, weight in self.FIELD_WEIGHTS:
+            value = (student.get(field, "") or "").lower()
+            parts = value.split() + ([value.split("@", 1)[0]] if field == "email" else [])
+            tokens += [(part, weight) for part in parts if part]
+        return tokens
+
+    def add(self, student):
+        netid = student["netid"]
+        tokens = self._tokens(student)
+        text = " ".join(t for t, _ in tokens)
+        self.entries[netid] = (tokens, text)
+        for token, weight in tokens:
+            for n in range(1, min(len(token), self.MAX_PREFIX) + 1):
+                bucket = self.prefixes.setdefault(token[:n], {})
+                bucket[netid] = max(bucket.get(netid, 0), weight)
+        for gram in _trigrams(text):
+            self.trigrams.setdefault(gram, set()).add(netid)
+
+    def remove(self, netid):
+        entry = self.entries.pop(netid, None)
+        if entry is None:
+            return
+        tokens, text = entry
+        for token, _ in tokens:
+            for n in range(1, min(len(token), self.MAX_PREFIX) + 1):
+                bucket = self.prefixes.get(token[:n])
+                if bucket is not None:
+                    bucket.pop(netid, None)
+                    if not bucket:
+                        del self.prefixes[token[:n]]
+        for gram in _trigrams(text):
+            bucket = self.trigrams.get(gram)
+            if bucket is not None:
+                bucket.discard(netid)
+                if not bucket:
+                    del self.trigrams[gram]
+
+    def sync(self, students):
+        # Reloads usually return the same roster; only re-index students whose fields changed.
+        seen = set()
+        for student in students:
+            netid = student["netid"]
+            seen.add(netid)
+            entry = self.entries.get(netid)
+            if entry is None or entry[0] != self._tokens(student):
+                self.remove(netid)
+                self.add(student)
+        for netid in set(self.entries) - seen:
+            self.remove(netid)
+
+    def search(self, query, limit=10):
+        words = query.lower().split()
+        if not words:
+            return []
+        scores = None
+        for word in words:
+            bucket = self.prefixes.get(word[: self.MAX_PREFIX], {})
+            if scores is None:
+                scores = dict(bucket)
+            else:
+                scores = {n: scores[n] + w for n, w in bucket.items() if n in scores}
+        for netid in scores:
+            if netid == words[0]:
+                scores[netid] += 100
+        ranked = sorted(scores, key=lambda n: (-scores[n], n))[:limit]
+        if len(ranked) < limit:
+            # Fall back to trigram overlap for typos and mid-word fragments.
+            grams = _trigrams(" ".join(words))
+            overlap = {}
+            for gram in grams:
+                for netid in self.trigrams.get(gram, ()):
+                    overlap[netid] = overlap.get(netid, 0) + 1
+            threshold = max(2, len(grams) // 2)
+            fuzzy = sorted(
+                (n for n, c in overlap.items() if c >= threshold and n not in scores),
+                key=lambda n: (-overlap[n], n),
+            )
+            ranked += fuzzy[: limit - len(ranked)]
+        return ranked
+
+
+class TextIndex:
+    # word -> {path: [1-based pages]}; files keeps each PDF's vocabulary so re-indexing one file stays cheap.
+    def __init__(self):
+        self.postings = {}
+        self.files = {}
+
+    def add(self, path, sig, pages):
+        self.remove(path)
+        words = set()
+        for page_no, page_words in enumerate(pages, 1):
+            for word in page_words:
+                self.postings.setdefault(word, {}).setdefault(path, []).append(page_no)
+                words.add(word)
+        self.files[path] = {"sig": sig, "pages": len(pages), "words": sorted(words)}
+
+    def remove(self, path):
+        entry = self.files.pop(path, None)
+        if not entry:
+            return
+        for word in entry["words"]:
+            hits = self.postings.get(word)
+            if hits is not None:
+                hits.pop(path, None)
+                if not hits:
+                    del self.postings[word]
+
+    def query(self, text, page=None):
+        terms = sorted(_comment_words(text), key=lambda w: len(self.postings.get(w, ())))
+        if not terms:
+            return {}
+        result = None
+        for term in terms:
+            hits = self.postings.get(term, {})
+            if result is None:
+                result = {path: set(pages) for path, pages in hits.items()}
+            else:
+                result = {path: pages & set(hits[path]) for path, pages in result.items() if path in hits}
+            if page is not None:
+                result = {path: pages & {page} for path, pages in result.items()}
+            result = {path: pages for path, pages in result.items() if pages}
+            if not result:
+                break
+        return {path: sorted(pages) for path, pages in result.items()}
+
+    def copy(self):
+        index = TextIndex()
+        index.postings = {
+            word: {path: list(pages) for path, pages in hits.items()} for word, hits in self.postings.items()
+        }
+        index.files = {path: dict(entry) for path, entry in self.files.items()}
+        return index
+
+    def to_dict(self):
+        return {"postings": self.postings, "files": self.files}
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        if isinstance(data.get("postings"), dict) and isinstance(data.get("files"), dict):
+            index.postings = data["postings"]
+            index.files = data["files"]
+        return index
 
 
 class QuizGraderApp:
@@ -24,14 +1923,31 @@ class QuizGraderApp:
         self.root.geometry("1400x860")
 
         self.base_dir = Path.cwd()
-        self.default_roster = self.base_dir / "roster.csv"
-        self.default_submissions = self.base_dir / "Quiz1"
-        self.state_path = self.base_dir / "grading_state.json"
-        self.export_path = self.base_dir / "grades_export.csv"
+        self.workspace = load_workspace(self.base_dir)
+        self.combined_export_path = self.base_dir / "gradebook_combined.csv"
+        self.default_roster = self.base_dir / self.workspace["roster"]
+        self.quiz_name = self.workspace["quizzes"][0]["name"]
+        self.quiz_sessions = {}
+        self.grader_id = os.environ.get("QUIZ_GRADER_ID") or getpass.getuser()
+        self.assignment = None
+        self.rubric_renames = []
+        self.rubric_registry = RubricRegistry()
+        self.inputs_signature = None
+        self.state_signature = None
+        stage_dir = os.environ.get("QUIZ_GRADER_STAGE_DIR")
+        stage_mb = int(os.environ.get("QUIZ_GRADER_STAGE_MB") or STAGE_DEFAULT_MB)
+        self.lms_url = os.environ.get("QUIZ_GRADER_LMS_URL")
+        self.lms_token = os.environ.get("QUIZ_GRADER_LMS_TOKEN")
+        self.lms_sync_running = False
+        self.stage_cache = SubmissionCache(stage_dir, stage_mb * 1024 * 1024) if stage_dir else None
 
         self.roster_path_var = tk.StringVar(value=str(self.default_roster))
-        self.submissions_path_var = tk.StringVar(value=str(self.default_submissions))
+        self.submissions_path_var = tk.StringVar()
+        self.quiz_var = tk.StringVar(value=self.quiz_name)
+        self._apply_quiz_paths(self.workspace["quizzes"][0])
         self.full_score_var = tk.StringVar(value="10")
+        self.lms_key_var = tk.StringVar(value="Email")
+        self.export_status_var = tk.StringVar(value="")
 
         self.students = []
         self.student_by_netid = {}
@@ -49,6 +1965,9 @@ class QuizGraderApp:
         self.pdf_tk_imgs = []
         self.pdf_page_offsets = []
         self.pdf_total_height = 1
+        self.pdf_page_is_gray = {}
+        self.pdf_render_note = ""
+        self.render_mode_var = tk.StringVar(value="Auto")
         self.last_canvas_width = 0
         self.unmatched_preview_path = None
 
@@ -88,11 +2007,73 @@ class QuizGraderApp:
         self.pdf_canvas_y_scroll = None
         self.add_rubric_btn = None
         self.cancel_rubric_edit_btn = None
+        self.tools_menu = None
+        self.answer_clusters = []
+        self.duplicate_groups = []
+        self.duplicates_var = tk.StringVar(value="Duplicates: not checked")
+        self.problem_files = {}
+        self.problems_var = tk.StringVar(value="File check: not run")
+        self.grade_index = GradeIndex()
+        self.export_dirty = set()
+        self.saved_records = {}
+        self.export_scores_stale = True
+        self.export_running = False
+        self.grade_stats = GradeStats()
+        self.stats_text = None
+        self._stats_refresh_id = None
+        self._scans_token = None
+        self._text_index_runs = {}
+        self.scans_complete = False
+        self.history = UndoHistory()
+        self._history_flush_id = None
+        self.search_index = StudentSearchIndex()
+        self.student_positions = {}
+        self.search_var = tk.StringVar()
+        self.search_row = None
+        self.search_results = None
+        self.search_matches = []
+
+        self.loading = False
+        self.load_progress = None
+        self.load_status_var = tk.StringVar(value="Starting...")
+        self.window_ready_ms = None
+        self.startup_ms = None
+        self.on_ready = None
+        self.switch_from = None
 
         self._build_ui()
-        self._load_data()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        # Let the window paint before any file I/O; loading continues in the background.
+        self.root.after(1, self._on_window_ready)
 
     def _build_ui(self):
+        menubar = tk.Menu(self.root)
+        edit_menu = tk.Menu(menubar, tearoff=0)
+        edit_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self._undo)
+        edit_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self._redo)
+        menubar.add_cascade(label="Edit", menu=edit_menu)
+        self.root.bind_all("<Control-z>", lambda _e: self._undo())
+        self.root.bind_all("<Control-y>", lambda _e: self._redo())
+        self.root.bind_all("<Control-Z>", lambda _e: self._redo())
+        quiz_menu = tk.Menu(menubar, tearoff=0)
+        quiz_menu.add_command(label="Add Quiz...", command=self._add_quiz)
+        quiz_menu.add_command(label="Export Combined Gradebook", command=self._export_combined_gradebook)
+        menubar.add_cascade(label="Quiz", menu=quiz_menu)
+        self.tools_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Tools", menu=self.tools_menu)
+        self.tools_menu.add_command(label="Answer Clusters...", command=self._open_cluster_dialog)
+        self.tools_menu.add_command(label="Bulk Edit...", command=self._open_bulk_dialog)
+        self.tools_menu.add_command(label="Split Batch Scan...", command=self._open_split_dialog)
+        self.tools_menu.add_command(label="Search Submission Text...", command=self._open_text_search)
+        self.tools_menu.add_command(label="Statistics", command=self._open_stats_panel)
+        self.tools_menu.add_command(label="Generate Feedback PDFs", command=self._generate_feedback)
+        lms_key_menu = tk.Menu(self.tools_menu, tearoff=0)
+        for key in ("Email", "Net ID"):
+            lms_key_menu.add_radiobutton(label=key, value=key, variable=self.lms_key_var)
+        self.tools_menu.add_cascade(label="LMS Export Key", menu=lms_key_menu)
+        self.tools_menu.add_command(label="Sync Grades to LMS", command=self._sync_lms)
+        self.root.config(menu=menubar)
+
         top = ttk.Frame(self.root, padding=8)
         top.pack(fill=tk.X)
 
@@ -104,6 +2085,17 @@ class QuizGraderApp:
 
         ttk.Label(top, text="Full Score").grid(row=0, column=3, sticky="e")
         ttk.Entry(top, textvariable=self.full_score_var, width=8).grid(row=0, column=4, sticky="w")
+        ttk.Label(top, text="Quiz").grid(row=1, column=3, sticky="e")
+        self.quiz_combo = ttk.Combobox(top, textvariable=self.quiz_var, state="readonly", width=14)
+        self.quiz_combo.grid(row=1, column=4, sticky="w")
+        self.quiz_combo["values"] = [q["name"] for q in self.workspace["quizzes"]]
+        self.quiz_combo.bind("<<ComboboxSelected>>", lambda _e: self._switch_quiz(self.quiz_var.get()))
+        self.full_score_var.trace_add("write", lambda *_: setattr(self, "export_scores_stale", True))
+
+        load_row = ttk.Frame(top)
+        load_row.grid(row=2, column=0, columnspan=5, sticky="we", pady=(4, 0))
+        ttk.Label(load_row, textvariable=self.load_status_var).pack(side=tk.LEFT)
+        self.load_progress = ttk.Progressbar(load_row, mode="indeterminate", length=160)
 
         top.columnconfigure(1, weight=1)
 
@@ -125,6 +2117,15 @@ class QuizGraderApp:
         ttk.Button(pdf_controls, text="Zoom -", command=self._pdf_zoom_out).pack(side=tk.LEFT)
         ttk.Button(pdf_controls, text="Zoom +", command=self._pdf_zoom_in).pack(side=tk.LEFT, padx=6)
         ttk.Button(pdf_controls, text="Reset Fit", command=self._pdf_reset_fit).pack(side=tk.LEFT, padx=6)
+        render_combo = ttk.Combobox(
+            pdf_controls,
+            textvariable=self.render_mode_var,
+            state="readonly",
+            values=["Auto", "Grayscale", "Color"],
+            width=10,
+        )
+        render_combo.pack(side=tk.LEFT)
+        render_combo.bind("<<ComboboxSelected>>", lambda _e: self._on_render_mode_changed())
         ttk.Label(pdf_controls, textvariable=self.pdf_status_var).pack(side=tk.LEFT, padx=10)
 
         pdf_canvas_wrap = ttk.Frame(pdf_box)
@@ -146,6 +2147,19 @@ class QuizGraderApp:
 
         self.info_box = ttk.LabelFrame(right, text="Current Student", padding=8)
         self.info_box.pack(fill=tk.X)
+        search_row = self.search_row = ttk.Frame(self.info_box)
+        search_row.pack(fill=tk.X, pady=(0, 4))
+        ttk.Label(search_row, text="Find").pack(side=tk.LEFT)
+        search_entry = ttk.Entry(search_row, textvariable=self.search_var)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(4, 0))
+        self.search_results = tk.Listbox(self.info_box, height=6)
+        self.search_var.trace_add("write", lambda *_: self._update_search_results())
+        search_entry.bind("<Return>", lambda _e: self._jump_to_search_result(0))
+        search_entry.bind("<Down>", lambda _e: self._focus_search_results())
+        search_entry.bind("<Escape>", lambda _e: self.search_var.set(""))
+        self.search_results.bind("<Return>", lambda _e: self._jump_to_search_result(None))
+        self.search_results.bind("<Double-Button-1>", lambda _e: self._jump_to_search_result(None))
+        self.root.bind_all("<Control-f>", lambda _e: search_entry.focus_set())
         ttk.Label(self.info_box, textvariable=self.info_name_var).pack(anchor="w")
         ttk.Label(self.info_box, textvariable=self.info_netid_var).pack(anchor="w")
         ttk.Label(self.info_box, textvariable=self.info_email_var).pack(anchor="w")
@@ -159,6 +2173,7 @@ class QuizGraderApp:
         ttk.Button(self.nav_bar, text="Previous", command=self._go_previous).pack(side=tk.LEFT, padx=6)
         ttk.Button(self.nav_bar, text="Next Student", command=self._go_next).pack(side=tk.LEFT)
         ttk.Button(self.nav_bar, text="Export CSV", command=self._export_csv).pack(side=tk.LEFT, padx=6)
+        ttk.Label(self.nav_bar, textvariable=self.export_status_var).pack(side=tk.LEFT)
 
         self.rubric_setup_box = ttk.LabelFrame(right, text="Rubric Setup", padding=8)
         self.rubric_setup_box.pack(fill=tk.X)
@@ -232,130 +2247,381 @@ class QuizGraderApp:
         ttk.Button(map_actions, text="Preview Unmatched", command=self._preview_unmatched_pdf).pack(side=tk.LEFT)
         ttk.Button(map_actions, text="Back to Student", command=self._exit_unmatched_preview).pack(side=tk.LEFT, padx=(6, 0))
         ttk.Button(self.map_box, text="Assign PDF to Student", command=self._assign_mapping).pack(fill=tk.X)
+        dup_row = ttk.Frame(self.map_box)
+        dup_row.pack(fill=tk.X, pady=(4, 0))
+        ttk.Label(dup_row, textvariable=self.duplicates_var).pack(side=tk.LEFT)
+        ttk.Button(dup_row, text="Review", command=self._open_duplicates_dialog).pack(side=tk.RIGHT)
+        check_row = ttk.Frame(self.map_box)
+        check_row.pack(fill=tk.X, pady=(4, 0))
+        ttk.Label(check_row, textvariable=self.problems_var).pack(side=tk.LEFT)
+        ttk.Button(check_row, text="Review", command=self._open_problem_files_dialog).pack(side=tk.RIGHT)
 
         reset_row = ttk.Frame(right)
         reset_row.pack(side=tk.BOTTOM, fill=tk.X, pady=(10, 0))
         ttk.Button(reset_row, text="Reset", width=8, command=self._clear_state_with_confirm).pack(anchor="e")
 
 
+    _SESSION_LABELS = ("problems_var", "duplicates_var")
+    _SESSION_ATTRS = (
+        "students",
+        "student_by_netid",
+        "grades",
+        "submissions",
+        "unmatched_files",
+        "manual_mappings",
+        "rubric_items",
+        "current_index",
+        "grade_index",
+        "grade_stats",
+        "history",
+        "export_dirty",
+        "saved_records",
+        "export_scores_stale",
+        "answer_clusters",
+        "duplicate_groups",
+        "problem_files",
+        "text_index",
+        "text_index_ready",
+        "scans_complete",
+        "inputs_signature",
+        "state_signature",
+        "student_positions",
+        "assignment",
+        "rubric_renames",
+        "rubric_registry",
+    )
+
+    def _quiz_config(self, name):
+        return next((q for q in self.workspace["quizzes"] if q["name"] == name), None)
+
+    def _apply_quiz_paths(self, quiz):
+        quiz_dir = self.base_dir / quiz.get("dir", ".")
+        self.default_submissions = self.base_dir / quiz.get("submissions", quiz["name"])
+        self.state_path = quiz_dir / "grading_state.json"
+        self.export_path = quiz_dir / "grades_export.csv"
+        self.cluster_cache_path = quiz_dir / "answer_cluster_cache.json"
+        self.lms_export_path = quiz_dir / "grades_lms_import.csv"
+        self.matrix_export_path = quiz_dir / "grades_rubric_matrix.csv"
+        self.feedback_dir = quiz_dir / "feedback"
+        self.history_path = quiz_dir / "grading_history.json"
+        self.fingerprint_cache_path = quiz_dir / "submission_fingerprints.json"
+        self.check_cache_path = quiz_dir / "submission_checks.json"
+        self.text_index_path = quiz_dir / "text_index.json"
+        self.lms_sync_state_path = quiz_dir / "lms_sync_state.json"
+        self.text_index = TextIndex()
+        self.text_index_ready = False
+        self.submissions_path_var.set(str(self.default_submissions))
+
+    def _workspace_relpath(self, path):
+        try:
+            return os.path.relpath(path, self.base_dir)
+        except ValueError:
+            return str(path)
+
+    def _remember_input_paths(self, roster_path, submissions_dir):
+        quiz = self._quiz_config(self.quiz_name)
+        roster = self._workspace_relpath(roster_path)
+        submissions = self._workspace_relpath(submissions_dir)
+        if quiz is not None and (quiz.get("submissions") != submissions or self.workspace["roster"] != roster):
+            quiz["submissions"] = submissions
+            self.workspace["roster"] = roster
+            save_workspace(self.base_dir, self.workspace)
+
+    def _session_is_fresh(self, session):
+        roster_path = Path(self.roster_path_var.get()).expanduser()
+        return session["inputs_signature"] == [
+            _path_signature(roster_path),
+            _path_signature(self.default_submissions),
+        ] and session["state_signature"] == _path_signature(self.state_path)
+
+    def _switch_quiz(self, name):
+        quiz = self._quiz_config(name)
+        if quiz is None or name == self.quiz_name or self.loading:
+            self.quiz_var.set(self.quiz_name)
+            return
+        self._persist_current_form(mark_graded=False)
+        if self.editing_rubric_index is not None:
+            self._cancel_rubric_edit()
+        roster_path = Path(self.roster_path_var.get()).expanduser()
+        submissions_dir = self.base_dir / quiz.get("submissions", quiz["name"])
+        # Check B's inputs before touching paths, so a failed switch never points A's data at B's files.
+        if not roster_path.exists() or not submissions_dir.exists():
+            missing = roster_path if not roster_path.exists() else submissions_dir
+            messagebox.showerror("Missing input", f"Cannot switch to {name}, not found:\n{missing}")
+            self.quiz_var.set(self.quiz_name)
+            return
+        self._flush_history()
+        session = {attr: getattr(self, attr) for attr in self._SESSION_ATTRS}
+        session["full_score"] = self.full_score_var.get()
+        for var in self._SESSION_LABELS:
+            session[var] = getattr(self, var).get()
+        self.quiz_sessions[self.quiz_name] = session
+        previous = self.quiz_name
+
+        self.quiz_name = name
+        self.quiz_var.set(name)
+        self._apply_quiz_paths(quiz)
+        self.unmatched_preview_path = None
+        self._close_pdf_doc()
+        self._clear_pdf_canvas()
+
+        cached = self.quiz_sessions.get(name)
+        if cached is not None and self._session_is_fresh(cached):
+            self._restore_session(name, cached)
+            self.load_status_var.set(f"Switched to {name} (unchanged, kept in memory)")
+            return
+        self.switch_from = previous
+        self._load_data()
+
+    def _restore_session(self, name, session):
+        self.quiz_name = name
+        self.quiz_var.set(name)
+        self._apply_quiz_paths(self._quiz_config(name))
+        self.full_score_var.set(session["full_score"])
+        for attr in self._SESSION_ATTRS:
+            setattr(self, attr, session[attr])
+        for var in self._SESSION_LABELS:
+            getattr(self, var).set(session.get(var, ""))
+        self.search_index.sync(self.students)
+        self._build_rubric_checkboxes()
+        self._refresh_mapping_controls()
+        self._show_current_student()
+        self._schedule_stats_refresh()
+        if not self.scans_complete:
+            # Switching away stopped this quiz's scans part way; the caches make the rerun cheap.
+            self._start_submission_scans()
+
+    def _publish_scan_result(self, quiz_name, values, labels=None):
+        # A pass can finish after the user switched quizzes; its results then go into that quiz's parked session.
+        labels = labels or {}
+        if quiz_name == self.quiz_name:
+            for attr, value in values.items():
+                setattr(self, attr, value)
+            for var, text in labels.items():
+                getattr(self, var).set(text)
+            return True
+        session = self.quiz_sessions.get(quiz_name)
+        if session is not None:
+            session.update(values)
+            session.update(labels)
+        return False
+
+    def _add_quiz(self):
+        name = simpledialog.askstring("Add Quiz", "Quiz name:", parent=self.root)
+        name = (name or "").strip()
+        if not name:
+            return
+        if self._quiz_config(name) is not None:
+            messagebox.showerror("Duplicate quiz", f"Quiz '{name}' already exists.")
+            return
+        folder = filedialog.askdirectory(title=f"Submissions folder for {name}", initialdir=str(self.base_dir))
+        if not folder:
+            return
+        quiz_dir = Path("quizzes") / name
+        (self.base_dir / quiz_dir).mkdir(parents=True, exist_ok=True)
+        self.workspace["quizzes"].append(
+            {"name": name, "submissions": self._workspace_relpath(folder), "dir": str(quiz_dir)}
+        )
+        save_workspace(self.base_dir, self.workspace)
+        self.quiz_combo["values"] = [q["name"] for q in self.workspace["quizzes"]]
+        self._switch_quiz(name)
+
+    def _export_combined_gradebook(self):
+        self._persist_current_form(mark_graded=False)
+        quiz_names = [q["name"] for q in self.workspace["quizzes"]]
+        in_memory = {}
+        for name, session in list(self.quiz_sessions.items()) + [(self.quiz_name, None)]:
+            grades = self.grades if session is None else session["grades"]
+            in_memory[name] = {
+                netid: _quiz_score_text(rec.get("status"), rec.get("score")) for netid, rec in grades.items()
+            }
+        state_paths = {
+            q["name"]: self.base_dir / q.get("dir", ".") / "grading_state.json" for q in self.workspace["quizzes"]
+        }
+        students = [(s["netid"], s["first"], s["last"], s["email"]) for s in self.students]
+        out_path = self.combined_export_path
+        self.export_status_var.set("Exporting combined gradebook...")
+        self._run_in_background(
+            lambda progress: write_combined_gradebook(
+                students, quiz_names, in_memory, state_paths, out_path, progress=progress
+            ),
+            lambda count: self.export_status_var.set(
+                f"Combined gradebook: {count} students x {len(quiz_names)} quizzes -> {out_path.name}"
+            ),
+            on_progress=lambda i, n: self.export_status_var.set(f"Combined gradebook {i}/{n}..."),
+        )
+
     def _load_data(self):
         roster_path = Path(self.roster_path_var.get()).expanduser()
         submissions_dir = Path(self.submissions_path_var.get()).expanduser()
 
         if not roster_path.exists():
-            messagebox.showerror("Missing file", f"Roster not found:\n{roster_path}")
+            self._report_load_error("Missing file", f"Roster not found:\n{roster_path}")
             return
         if not submissions_dir.exists():
-            messagebox.showerror("Missing folder", f"Submissions folder not found:\n{submissions_dir}")
+            self._report_load_error("Missing folder", f"Submissions folder not found:\n{submissions_dir}")
+            return
+        if self.loading:
             return
+        self._flush_history()
+        self._remember_input_paths(roster_path, submissions_dir)
+
+        self.loading = True
+        self.load_status_var.set(f"Loading {self.quiz_name}: roster and submissions...")
+        if self.load_progress is not None:
+            self.load_progress.pack(side=tk.LEFT, padx=(8, 0))
+            self.load_progress.start(12)
+        state_path = self.state_path
+        self._run_in_background(
+            lambda progress: self._read_inputs(roster_path, submissions_dir, state_path, progress),
+            self._apply_loaded_inputs,
+            on_progress=lambda text: self.load_status_var.set(text),
+            on_error=self._load_failed,
+        )
 
-        self.students = []
-        self.student_by_netid = {}
-        self.submissions = {}
-        self.unmatched_files = []
+    def _read_inputs(self, roster_path, submissions_dir, state_path, progress):
+        signature = [_path_signature(roster_path), _path_signature(submissions_dir)]
+        students = read_roster_cached(roster_path)
+        progress(f"Loaded {len(students)} students, reading saved state...")
+        saved = read_state(state_path)
+        progress("Scanning submissions...")
+        manual_mappings = saved.get("manual_mappings", {}) or {}
+        submissions, unmatched = match_submissions(students, submissions_dir, manual_mappings)
+        progress(f"Found {len(submissions)} submissions, preparing viewer...")
+        # Warm the PDF libraries off the UI thread so the first render does not pay the import.
+        _ensure_pdf_libs()
+        return students, saved, submissions, unmatched, signature, _path_signature(state_path)
+
+    def _load_failed(self, exc):
+        self._finish_loading(f"Load failed: {exc}")
+        if self.switch_from is not None:
+            # The previous quiz's data is still live; point the paths back at it.
+            previous, self.switch_from = self.switch_from, None
+            self._restore_session(previous, self.quiz_sessions[previous])
+        self._report_load_error("Load failed", str(exc))
+
+    def _report_load_error(self, title, message):
+        if self.on_ready is not None:
+            # --startup-check is waiting on on_ready; a modal dialog would leave it hanging.
+            print(f"{title}: {message}", file=sys.stderr)
+            self.on_ready()
+        else:
+            messagebox.showerror(title, message)
+
+    def _finish_loading(self, text):
+        self.loading = False
+        if self.load_progress is not None:
+            self.load_progress.stop()
+            self.load_progress.pack_forget()
+        self.load_status_var.set(text)
+
+    def _apply_loaded_inputs(self, result):
+        students, saved, submissions, unmatched, self.inputs_signature, self.state_signature = result
+        self.assignment = saved.get("assignment")
+        if self.assignment:
+            # A shard only grades its assigned students; everyone else belongs to another grader.
+            assigned = set(self.assignment.get("netids", []))
+            students = [s for s in students if s["netid"] in assigned]
+            submissions = {n: p for n, p in submissions.items() if n in assigned}
+        self.students = students
+        self.student_by_netid = {s["netid"]: s for s in self.students}
+        self.student_positions = {s["netid"]: i for i, s in enumerate(self.students)}
+        self.search_index.sync(self.students)
         self.unmatched_preview_path = None
 
-        with roster_path.open(newline="", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if (row.get("Role", "") or "").strip() != "Student":
-                    continue
-                netid = (row.get("Net ID", "") or "").strip().lower()
-                if not netid:
-                    continue
-                student = {
-                    "netid": netid,
-                    "first": (row.get("First Name", "") or "").strip(),
-                    "last": (row.get("Last Name", "") or "").strip(),
-                    "email": (row.get("Email", "") or "").strip(),
-                    "submission": None,
-                }
-                self.students.append(student)
-                self.student_by_netid[netid] = student
-
-        self.students.sort(key=lambda s: (s["last"].lower(), s["first"].lower(), s["netid"]))
-
-        pdf_paths = sorted(submissions_dir.glob("*.pdf"))
-        by_stem = {p.stem.lower(): p for p in pdf_paths}
-
-        saved = self._read_saved_state()
         self.rubric_items = saved.get("rubric_items", []) or []
         self.manual_mappings = saved.get("manual_mappings", {}) or {}
-        self.grades = saved.get("grades", {}) or {}
+        self.rubric_registry = RubricRegistry((item.get("name", "") or "").strip() for item in self.rubric_items)
+        self.grades = {
+            netid: GradeRecord.from_dict(rec, self.rubric_registry)
+            for netid, rec in (saved.get("grades", {}) or {}).items()
+            if isinstance(rec, dict)
+        }
+        self.rubric_renames = saved.get("rubric_renames", []) or []
         if saved.get("full_score") is not None:
             self.full_score_var.set(str(saved.get("full_score")))
-
-        for netid, student in self.student_by_netid.items():
-            if netid in by_stem:
-                student["submission"] = str(by_stem[netid])
-                self.submissions[netid] = str(by_stem[netid])
-
-        for filename, mapped_netid in self.manual_mappings.items():
-            mapped_netid = (mapped_netid or "").strip().lower()
-            if mapped_netid in self.student_by_netid:
-                path = submissions_dir / filename
-                if path.exists():
-                    self.student_by_netid[mapped_netid]["submission"] = str(path)
-                    self.submissions[mapped_netid] = str(path)
-
-        student_netids = set(self.student_by_netid.keys())
-        for p in pdf_paths:
-            if p.stem.lower() not in student_netids and p.name not in self.manual_mappings:
-                self.unmatched_files.append(p.name)
-
-        self._ensure_grade_defaults()
+        self.submissions, self.unmatched_files = submissions, unmatched
+
+        self.history = UndoHistory.from_dict(_read_json_cache(self.history_path))
+        # Fresh objects: a stashed quiz session may still reference the previous ones.
+        self.grade_index = GradeIndex()
+        self.grade_stats = GradeStats()
+        self.export_dirty = set()
+        self.saved_records = {}
+        self.duplicate_groups = []
+        self.problem_files = {}
+        self.answer_clusters = []
+        self.switch_from = None
+        modified = self._ensure_grade_defaults()
         self._build_rubric_checkboxes()
         self._refresh_mapping_controls()
 
         self.current_index = self._first_ungraded_index()
         self._show_current_student()
-        self._save_state()
 
-    def _read_saved_state(self):
-        if not self.state_path.exists():
-            return {}
-        try:
-            with self.state_path.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {}
+        text = f"Loaded {len(self.students)} students, {len(self.submissions)} submissions"
+        if self.startup_ms is None:
+            self.startup_ms = (time.perf_counter() - _PROCESS_START) * 1000
+            text += f" (ready in {self.startup_ms:.0f} ms, window in {self.window_ready_ms:.0f} ms)"
+            if self.window_ready_ms > STARTUP_TARGET_MS:
+                print(
+                    f"warning: window took {self.window_ready_ms:.0f} ms to become interactive "
+                    f"(target {STARTUP_TARGET_MS} ms)",
+                    file=sys.stderr,
+                )
+        self._finish_loading(text)
+        if modified or not self.state_path.exists():
+            self._save_state()
+        self._start_submission_scans()
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def _on_window_ready(self):
+        # after(1) can fire before the first paint; flush pending geometry and redraws so the time covers them.
+        self.root.update_idletasks()
+        self.window_ready_ms = (time.perf_counter() - _PROCESS_START) * 1000
+        self._load_data()
 
     def _new_record(self):
-        return {
-            "selected_rubrics": [],
-            "extra_deduction": 0.0,
-            "comments": "",
-            "graded": False,
-            "status": "ungraded",
-            "score": None,
-            "total_deduction": 0.0,
-        }
+        return GradeRecord(self.rubric_registry)
 
     def _get_record(self, netid, create=False):
         rec = self.grades.get(netid)
-        if not isinstance(rec, dict):
-            rec = None
         if rec is None and create:
             rec = self._new_record()
             self.grades[netid] = rec
         return rec
 
     def _ensure_grade_defaults(self):
+        modified = False
         for s in self.students:
-            netid = s["netid"]
+            netid = s.netid
+            changed = netid not in self.grades
             rec = self._get_record(netid, create=True)
-            for k, v in self._new_record().items():
-                if k not in rec:
-                    rec[k] = v
 
-            if not s["submission"]:
-                rec["graded"] = True
-                rec["status"] = "missing"
-                rec["score"] = 0.0
-            elif rec.get("status") == "missing":
-                rec["graded"] = False
-                rec["status"] = "ungraded"
-                rec["score"] = None
+            if not s.submission:
+                changed = changed or rec.status_code is not RecordStatus.MISSING or rec.score != 0.0
+                rec.graded = True
+                rec.status_code = RecordStatus.MISSING
+                rec.score = 0.0
+            elif rec.status_code is RecordStatus.MISSING:
+                changed = True
+                rec.graded = False
+                rec.status_code = RecordStatus.UNGRADED
+                rec.score = None
+            modified = modified or changed
+            if changed or netid not in self.grade_index.entries:
+                self._record_changed(netid)
+        return modified
+
+    def _record_changed(self, netid):
+        rec = self._get_record(netid)
+        self.grade_index.update(netid, rec)
+        student = self.student_by_netid.get(netid)
+        self.grade_stats.update(netid, rec, student.get("section", "") if student else "")
+        self.export_dirty.add(netid)
+        self.saved_records.pop(netid, None)
+        self._schedule_stats_refresh()
 
     def _build_rubric_checkboxes(self):
         for child in self.rubric_checks_frame.winfo_children():
@@ -394,19 +2660,53 @@ class QuizGraderApp:
         self._on_rubric_frame_configure(None)
 
     def _remove_rubric_item(self, name):
+        if self._blocked_while_loading():
+            return
+        idx = next((i for i, x in enumerate(self.rubric_items) if (x.get("name", "").strip() == name)), None)
+        if idx is None:
+            return
+        self._persist_current_form(mark_graded=False)
+        item = dict(self.rubric_items[idx])
         self.rubric_items = [item for item in self.rubric_items if (item.get("name", "").strip() != name)]
         if self.editing_rubric_name == name:
             self._cancel_rubric_edit()
-        for rec in self.grades.values():
+        positions = self._drop_rubric_from_records(name)
+        self.history.push({"op": "rubric_remove", "index": idx, "item": item, "positions": positions})
+        self._refresh_after_rubric_change()
+
+    def _drop_rubric_from_records(self, name):
+        positions = {}
+        for netid, rec in self.grades.items():
             selected = rec.get("selected_rubrics", [])
-            if isinstance(selected, list):
+            if isinstance(selected, list) and name in selected:
+                positions[netid] = selected.index(name)
                 rec["selected_rubrics"] = [x for x in selected if x != name]
+        self.grade_index.drop_rubric(name)
+        self.grade_stats.drop_rubric(name)
+        return positions
+
+    def _rename_rubric_in_records(self, old_name, name):
+        self.rubric_renames.append({"old": old_name, "new": name, "at": time.time(), "grader": self.grader_id})
+        # Records store bits, so renaming the registry entry renames every selection at once.
+        if not self.rubric_registry.rename(old_name, name):
+            for rec in self.grades.values():
+                selected = rec.get("selected_rubrics", [])
+                if old_name in selected:
+                    rec["selected_rubrics"] = [name if x == old_name else x for x in selected]
+        self.grade_index.rename_rubric(old_name, name)
+        self.grade_stats.rename_rubric(old_name, name)
+
+    def _refresh_after_rubric_change(self):
+        self.rubric_registry.set_order((item.get("name", "") or "").strip() for item in self.rubric_items)
+        self.saved_records = {}
         self._recalculate_all_scores()
         self._build_rubric_checkboxes()
         self._show_current_student()
         self._save_state()
 
     def _start_edit_rubric(self, name):
+        if self._blocked_while_loading():
+            return
         idx = next((i for i, x in enumerate(self.rubric_items) if (x.get("name", "").strip() == name)), None)
         if idx is None:
             return
@@ -429,33 +2729,40 @@ class QuizGraderApp:
             self.cancel_rubric_edit_btn.pack_forget()
 
     def _recalculate_all_scores(self):
-        for s in self.students:
-            if not s.get("submission"):
-                rec = self._get_record(s["netid"], create=True)
-                rec["status"] = "missing"
-                rec["graded"] = True
-                rec["score"] = 0.0
-                rec["selected_rubrics"] = []
-                rec["extra_deduction"] = 0.0
-                rec["total_deduction"] = 0.0
-                continue
-            rec = self._get_record(s["netid"], create=True)
-            if rec.get("status") != "graded":
-                rec["score"] = None
-                continue
-            selected = rec.get("selected_rubrics", [])
-            if not isinstance(selected, list):
-                selected = []
-            score, total_deduction, extra = self._compute_score_from_values(selected, rec.get("extra_deduction", 0.0))
-            rec["score"] = score
-            rec["total_deduction"] = total_deduction
-            rec["extra_deduction"] = extra
+        self._recalculate_scores(self.students)
+
+    def _recalculate_scores(self, students):
+        full_score = self._safe_float(self.full_score_var.get(), 10.0)
+        rubric_points = self._rubric_points()
+        names_for = self.rubric_registry.names_for
+        mask_points = {}
+        for s in students:
+            rec = self._get_record(s.netid, create=True)
+            if not s.submission:
+                rec.status_code = RecordStatus.MISSING
+                rec.graded = True
+                rec.score = 0.0
+                rec.rubrics = 0
+                rec.extra_deduction = 0.0
+                rec.total_deduction = 0.0
+            elif rec.status_code is not RecordStatus.GRADED:
+                rec.score = None
+            else:
+                points = mask_points.get(rec.rubrics)
+                if points is None:
+                    points = mask_points[rec.rubrics] = sum(rubric_points.get(n, 0.0) for n in names_for(rec.rubrics))
+                extra = self._safe_float(rec.extra_deduction, 0.0)
+                rec.extra_deduction = extra
+                rec.total_deduction = points + extra
+                rec.score = max(0.0, full_score - rec.total_deduction)
+            self._record_changed(s.netid)
+
+    def _rubric_points(self):
+        return {(i.get("name", "") or "").strip(): self._safe_float(i.get("points", 0.0), 0.0) for i in self.rubric_items}
 
     def _compute_score_from_values(self, selected_names, extra_value):
         full_score = self._safe_float(self.full_score_var.get(), 10.0)
-        rubric_points = {
-            (i.get("name", "") or "").strip(): self._safe_float(i.get("points", 0.0), 0.0) for i in self.rubric_items
-        }
+        rubric_points = self._rubric_points()
         total_deduction = sum(rubric_points.get(n, 0.0) for n in selected_names)
         extra = self._safe_float(extra_value, 0.0)
         total_deduction += extra
@@ -518,6 +2825,8 @@ class QuizGraderApp:
             self.map_student_choice_var.set("")
 
     def _assign_mapping(self):
+        if self._blocked_while_loading():
+            return
         filename = self.unmatched_choice_var.get().strip()
         student_label = self.map_student_choice_var.get().strip()
         if not filename or not student_label:
@@ -531,7 +2840,7 @@ class QuizGraderApp:
             return
 
         pdf_path = Path(self.submissions_path_var.get()).expanduser() / filename
-        if not pdf_path.exists():
+        if filename not in self.unmatched_files:
             messagebox.showerror("Missing PDF", f"File not found:\n{pdf_path}")
             return
 
@@ -544,6 +2853,7 @@ class QuizGraderApp:
             rec["graded"] = False
             rec["status"] = "ungraded"
             rec["score"] = None
+        self._record_changed(netid)
 
         self.unmatched_files = [x for x in self.unmatched_files if x != filename]
         if self.unmatched_preview_path and Path(self.unmatched_preview_path).name == filename:
@@ -559,7 +2869,7 @@ class QuizGraderApp:
             messagebox.showerror("Missing selection", "Pick an unmatched PDF to preview.")
             return
         path = Path(self.submissions_path_var.get()).expanduser() / filename
-        if not path.exists():
+        if filename not in self.unmatched_files:
             messagebox.showerror("Missing PDF", f"File not found:\n{path}")
             return
         self.unmatched_preview_path = str(path)
@@ -576,9 +2886,7 @@ class QuizGraderApp:
             return default
 
     def _fmt(self, x):
-        if abs(x - int(x)) < 1e-9:
-            return str(int(x))
-        return f"{x:.2f}"
+        return _fmt_number(x)
 
     def _current_student(self):
         if not self.students:
@@ -635,6 +2943,7 @@ class QuizGraderApp:
 
         self._ensure_grade_defaults()
 
+        self.history.seal()
         s = self._current_student()
         rec = self._get_record(s["netid"], create=True)
         display_name = f"{s['last']}, {s['first']}"
@@ -647,27 +2956,18 @@ class QuizGraderApp:
         else:
             self.info_submission_var.set("Submission: MISSING (auto 0)")
 
-        total = len(self.students)
-        submission_total = sum(1 for st in self.students if st["submission"])
-        manual_graded = sum(
-            1
-            for st in self.students
-            if st["submission"] and self._get_record(st["netid"], create=True).get("status") == "graded"
-        )
-        missing_auto_zero = total - submission_total
-        self.info_progress_var.set(
-            f"student {self.current_index + 1}/{total}, graded {manual_graded}/{submission_total} "
-            f"(missing auto-0: {missing_auto_zero}), status={rec.get('status', 'ungraded')}"
-        )
+        self._show_progress(rec)
 
         self._load_form_from_record(s["netid"])
         self._load_embedded_pdf_for_current()
 
     def _persist_current_form(self, mark_graded=False):
-        if not self.students or self._loading_form:
+        # While a load is in flight the records and paths are about to be replaced; never write through them.
+        if not self.students or self._loading_form or self.loading:
             return
         s = self._current_student()
         rec = self._get_record(s["netid"], create=True)
+        before = _record_snapshot(rec)
 
         if not s["submission"]:
             rec["graded"] = True
@@ -684,6 +2984,8 @@ class QuizGraderApp:
             rec["total_deduction"] = total_deduction
             rec["comments"] = self.comments_text.get("1.0", tk.END).strip()
             if mark_graded:
+                if rec.get("status") != "graded":
+                    rec["graded_at"] = time.time()
                 rec["graded"] = True
                 rec["status"] = "graded"
                 rec["score"] = score
@@ -698,27 +3000,62 @@ class QuizGraderApp:
                     rec["status"] = "ungraded"
                     rec["score"] = None
 
+        self._record_changed(s["netid"])
+        self._push_record_history({s["netid"]: before}, focus=s["netid"], merge=True)
         self._save_state()
 
+    def _push_record_history(self, befores, focus=None, merge=False):
+        changes = {}
+        for netid, before in befores.items():
+            old, new = _record_diff(before, self._get_record(netid, create=True))
+            if old:
+                changes[netid] = (old, new)
+        self._stamp_records(changes)
+        if changes:
+            self.history.push({"op": "records", "focus": focus, "changes": changes}, merge_key=focus if merge else None)
+
+    def _stamp_records(self, netids):
+        # Per-record provenance lets merge_states pick the latest edit when shards overlap.
+        now = time.time()
+        for netid in netids:
+            rec = self._get_record(netid, create=True)
+            rec["updated_at"] = now
+            rec["grader"] = self.grader_id
+            self.saved_records.pop(netid, None)
+
+    def _blocked_while_loading(self):
+        # The finished load replaces records, rubric and history, so anything changed now would be lost.
+        if self.loading:
+            messagebox.showinfo("Still loading", "Wait for the data to finish loading before making changes.")
+        return self.loading
+
     def _on_form_changed(self):
         if self._loading_form:
             return
+        if self.loading:
+            self.load_status_var.set("Still loading: changes typed now are discarded when the data comes in")
+            return
         self._update_score_preview()
         self._persist_current_form(mark_graded=False)
         if self.students:
-            rec = self._get_record(self._current_student()["netid"], create=True)
-            total = len(self.students)
-            submission_total = sum(1 for st in self.students if st["submission"])
-            manual_graded = sum(
-                1
-                for st in self.students
-                if st["submission"] and self._get_record(st["netid"], create=True).get("status") == "graded"
-            )
-            missing_auto_zero = total - submission_total
-            self.info_progress_var.set(
-                f"student {self.current_index + 1}/{total}, graded {manual_graded}/{submission_total} "
-                f"(missing auto-0: {missing_auto_zero}), status={rec.get('status', 'ungraded')}"
-            )
+            self._show_progress(self._get_record(self._current_student()["netid"], create=True))
+
+    def _show_progress(self, rec):
+        # Runs on every keystroke and navigation; slot reads keep the roster scan cheap.
+        grades = self.grades
+        submission_total = manual_graded = 0
+        for st in self.students:
+            if st.submission:
+                submission_total += 1
+                other = grades.get(st.netid)
+                if other is not None and other.status_code is RecordStatus.GRADED:
+                    manual_graded += 1
+        total = len(self.students)
+        missing_auto_zero = total - submission_total
+        self.info_progress_var.set(
+            f"student {self.current_index + 1}/{total}, graded {manual_graded}/{submission_total} "
+            f"(missing auto-0: {missing_auto_zero}), status={_STATUS_NAMES[rec.status_code]}"
+        )
 
     def _go_previous(self):
         if not self.students:
@@ -758,6 +3095,8 @@ class QuizGraderApp:
         messagebox.showinfo("Done", "No ungraded students with submissions remain.")
 
     def _grade_and_next_ungraded(self):
+        if self._blocked_while_loading():
+            return
         if not self.students:
             return
         self._persist_current_form(mark_graded=True)
@@ -810,6 +3149,8 @@ class QuizGraderApp:
                 pass
         self.pdf_doc = None
         self.current_pdf_path = None
+        self.pdf_page_is_gray = {}
+        self.pdf_render_note = ""
         self.pdf_tk_imgs = []
         self.pdf_page_offsets = []
         self.pdf_total_height = 1
@@ -832,7 +3173,7 @@ class QuizGraderApp:
             self._pdf_set_status("PDF: missing submission")
             return
 
-        if not PDF_EMBED_AVAILABLE:
+        if not _ensure_pdf_libs():
             self._close_pdf_doc()
             self._clear_pdf_canvas()
             self._pdf_set_status("PDF: install pymupdf + pillow")
@@ -846,16 +3187,18 @@ class QuizGraderApp:
         self.pdf_zoom_multiplier = 1.0
         self.last_canvas_width = 0
         try:
-            self.pdf_doc = fitz.open(path)
+            local = self.stage_cache.lookup(path) if self.stage_cache else None
+            self.pdf_doc = fitz.open(local or path)
             self.current_pdf_path = path
             self._render_pdf_document(preserve_view=False)
         except Exception as exc:
             self._close_pdf_doc()
             self._clear_pdf_canvas()
-            self._pdf_set_status(f"PDF load failed: {exc}")
+            problem = self.problem_files.get(path)
+            self._pdf_set_status(f"PDF problem: {problem}" if problem else f"PDF load failed: {exc}")
 
     def _render_pdf_document(self, preserve_view=True):
-        if not PDF_EMBED_AVAILABLE or self.pdf_doc is None:
+        if self.pdf_doc is None:
             return
         page_count = len(self.pdf_doc)
         if page_count == 0:
@@ -872,6 +3215,9 @@ class QuizGraderApp:
         y = gap
         offsets = []
         imgs = []
+        gray_pages = 0
+        pixmap_bytes = 0
+        rgb_bytes = 0
 
         self._clear_pdf_canvas()
 
@@ -881,11 +3227,16 @@ class QuizGraderApp:
             base_scale = canvas_w / page_w
             scale = max(0.2, min(5.0, base_scale * self.pdf_zoom_multiplier))
             matrix = fitz.Matrix(scale, scale)
-            pix = page.get_pixmap(matrix=matrix, alpha=False)
-            mode = "RGB" if pix.n < 4 else "RGBA"
-            img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
-            if mode == "RGBA":
-                img = img.convert("RGB")
+            gray = self._render_page_gray(i, page)
+            if gray:
+                pix = page.get_pixmap(matrix=matrix, colorspace=fitz.csGRAY, alpha=False)
+                img = Image.frombytes("L", [pix.width, pix.height], pix.samples)
+                gray_pages += 1
+            else:
+                pix = page.get_pixmap(matrix=matrix, alpha=False)
+                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            pixmap_bytes += len(pix.samples)
+            rgb_bytes += pix.width * pix.height * 3
 
             tk_img = ImageTk.PhotoImage(img)
             imgs.append(tk_img)
@@ -895,6 +3246,9 @@ class QuizGraderApp:
             y += tk_img.height() + gap
 
         self.pdf_tk_imgs = imgs
+        self.pdf_render_note = (
+            f"gray {gray_pages}/{page_count}  {pixmap_bytes / 1e6:.1f} MB (saved {(rgb_bytes - pixmap_bytes) / 1e6:.1f} MB)"
+        )
         self.pdf_page_offsets = offsets
         self.pdf_total_height = max(y, 1)
         self.pdf_canvas.configure(scrollregion=(0, 0, max(canvas_w + 8, 100), self.pdf_total_height))
@@ -934,8 +3288,24 @@ class QuizGraderApp:
         prefix = "[UNMATCHED PREVIEW] " if self.unmatched_preview_path else ""
         self._pdf_set_status(
             f"{prefix}PDF: {name}  page {page_idx + 1}/{page_count}  zoom {self.pdf_zoom_multiplier:.2f}x fit"
+            f"  {self.pdf_render_note}"
         )
 
+    def _render_page_gray(self, page_idx, page):
+        mode = self.render_mode_var.get()
+        if mode != "Auto":
+            return mode == "Grayscale"
+        if page_idx not in self.pdf_page_is_gray:
+            # A tiny colour thumbnail is enough to tell a B/W scan from a page with real colour.
+            thumb = page.get_pixmap(matrix=fitz.Matrix(0.1, 0.1), alpha=False)
+            img = Image.frombytes("RGB", [thumb.width, thumb.height], thumb.samples)
+            self.pdf_page_is_gray[page_idx] = img.convert("HSV").getchannel("S").getextrema()[1] <= 24
+        return self.pdf_page_is_gray[page_idx]
+
+    def _on_render_mode_changed(self):
+        if self.pdf_doc is not None:
+            self._render_pdf_document(preserve_view=True)
+
     def _pdf_prev_page(self):
         if self.pdf_doc is None:
             return
@@ -959,6 +3329,8 @@ class QuizGraderApp:
         self._render_pdf_document(preserve_view=True)
 
     def _add_rubric_item(self):
+        if self._blocked_while_loading():
+            return
         name = self.add_rubric_name_var.get().strip()
         points = self._safe_float(self.add_rubric_points_var.get(), None)
         if not name:
@@ -972,7 +3344,9 @@ class QuizGraderApp:
             if any((item.get("name", "").strip() == name) for item in self.rubric_items):
                 messagebox.showerror("Duplicate rubric", f"Rubric '{name}' already exists.")
                 return
-            self.rubric_items.append({"name": name, "points": points})
+            item = {"name": name, "points": points, "updated_at": time.time()}
+            self.rubric_items.append(item)
+            self.history.push({"op": "rubric_add", "index": len(self.rubric_items) - 1, "item": dict(item)})
             self.add_rubric_name_var.set("")
             self.add_rubric_points_var.set("1")
         else:
@@ -989,32 +3363,139 @@ class QuizGraderApp:
                 messagebox.showerror("Duplicate rubric", f"Rubric '{name}' already exists.")
                 return
 
+            before = dict(self.rubric_items[edit_idx])
             self.rubric_items[edit_idx]["name"] = name
             self.rubric_items[edit_idx]["points"] = points
+            self.rubric_items[edit_idx]["updated_at"] = time.time()
+            self.history.push(
+                {"op": "rubric_edit", "index": edit_idx, "before": before, "after": dict(self.rubric_items[edit_idx])}
+            )
 
             if name != old_name:
-                for rec in self.grades.values():
-                    selected = rec.get("selected_rubrics", [])
-                    if isinstance(selected, list):
-                        rec["selected_rubrics"] = [name if x == old_name else x for x in selected]
+                self._rename_rubric_in_records(old_name, name)
             self._cancel_rubric_edit()
 
-        self._recalculate_all_scores()
-        self._build_rubric_checkboxes()
-        self._show_current_student()
-        self._save_state()
+        self._refresh_after_rubric_change()
 
-    def _save_state(self):
+    def _state_payload(self):
         payload = {
             "full_score": self._safe_float(self.full_score_var.get(), 10.0),
             "rubric_items": self.rubric_items,
             "manual_mappings": self.manual_mappings,
-            "grades": self.grades,
+            "grades": self._saved_grades(),
         }
+        if self.rubric_renames:
+            payload["rubric_renames"] = self.rubric_renames
+        if self.assignment:
+            payload["assignment"] = self.assignment
+        return payload
+
+    def _saved_grades(self):
+        # Serialized records are kept until _record_changed or a rubric rename/removal invalidates them,
+        # so a save only rebuilds the records that were actually edited.
+        saved = self.saved_records
+        grades = {}
+        for netid, rec in self.grades.items():
+            data = saved.get(netid)
+            if data is None:
+                data = saved[netid] = rec.to_dict()
+            grades[netid] = data
+        return grades
+
+    def _save_state(self):
+        if self.loading:
+            return
         with self.state_path.open("w", encoding="utf-8") as f:
-            json.dump(payload, f, indent=2)
+            json.dump(self._state_payload(), f, indent=2)
+        self.state_signature = _path_signature(self.state_path)
+        self._schedule_history_flush()
+
+    def _schedule_history_flush(self):
+        # The undo log can hold 200 snapshots; rewriting it per keystroke is the slow part of a save.
+        if not self.history.dirty or self._history_flush_id is not None:
+            return
+        self._history_flush_id = self.root.after(2000, self._flush_history)
+
+    def _flush_history(self):
+        if self._history_flush_id is not None:
+            self.root.after_cancel(self._history_flush_id)
+            self._history_flush_id = None
+        if self.loading or not self.history.dirty:
+            return
+        _write_json_cache(self.history_path, self.history.to_dict())
+        self.history.dirty = False
+
+    def _on_close(self):
+        if not self.loading:
+            self._persist_current_form(mark_graded=False)
+        self._flush_history()
+        self.root.destroy()
+
+    def _undo(self):
+        self._step_history(undo=True)
+
+    def _redo(self):
+        self._step_history(undo=False)
+
+    def _step_history(self, undo):
+        if not self.students or self.loading:
+            return
+        self._persist_current_form(mark_graded=False)
+        op = self.history.pop_undo() if undo else self.history.pop_redo()
+        if op is None:
+            self.export_status_var.set("Nothing to undo" if undo else "Nothing to redo")
+            return
+        if self.editing_rubric_index is not None:
+            self._cancel_rubric_edit()
+        kind = op["op"]
+        if kind == "records":
+            side = 0 if undo else 1
+            for netid, pair in op["changes"].items():
+                rec = self._get_record(netid, create=True)
+                for k, v in pair[side].items():
+                    rec[k] = list(v) if isinstance(v, list) else v
+                self._record_changed(netid)
+            self._stamp_records(op["changes"])
+            focus = self.student_positions.get(op.get("focus"))
+            if focus is not None:
+                self.current_index = focus
+            self.unmatched_preview_path = None
+            self._show_current_student()
+            self._save_state()
+        elif kind == "rubric_add":
+            if undo:
+                name = op["item"]["name"]
+                self.rubric_items = [i for i in self.rubric_items if (i.get("name", "") or "").strip() != name]
+                self._drop_rubric_from_records(name)
+            else:
+                self.rubric_items.insert(min(op["index"], len(self.rubric_items)), dict(op["item"]))
+            self._refresh_after_rubric_change()
+        elif kind == "rubric_edit":
+            old, new = (op["after"], op["before"]) if undo else (op["before"], op["after"])
+            idx = next((i for i, x in enumerate(self.rubric_items) if (x.get("name", "") or "").strip() == old["name"]), None)
+            if idx is not None:
+                self.rubric_items[idx] = dict(new)
+                if old["name"] != new["name"]:
+                    self._rename_rubric_in_records(old["name"], new["name"])
+            self._refresh_after_rubric_change()
+        elif kind == "rubric_remove":
+            name = op["item"]["name"]
+            if undo:
+                self.rubric_items.insert(min(op["index"], len(self.rubric_items)), dict(op["item"]))
+                for netid, pos in op["positions"].items():
+                    rec = self._get_record(netid, create=True)
+                    selected = [x for x in rec.get("selected_rubrics", []) if x != name]
+                    selected.insert(min(pos, len(selected)), name)
+                    rec["selected_rubrics"] = selected
+            else:
+                self.rubric_items = [i for i in self.rubric_items if (i.get("name", "") or "").strip() != name]
+                op["positions"] = self._drop_rubric_from_records(name)
+            self._refresh_after_rubric_change()
+        self.export_status_var.set(("Undid " if undo else "Redid ") + kind.replace("_", " "))
 
     def _clear_state_with_confirm(self):
+        if self._blocked_while_loading():
+            return
         confirmed = messagebox.askyesno(
             "Reset State",
             "This will permanently clear saved grades, rubric items, and manual PDF mappings.\n\nContinue?",
@@ -1026,21 +3507,130 @@ class QuizGraderApp:
         self.rubric_items = []
         self.manual_mappings = {}
         self.grades = {}
+        self.rubric_renames = []
+        self.assignment = None
+        self.history = UndoHistory()
+        self._flush_history()
         try:
             if self.state_path.exists():
                 self.state_path.unlink()
+            if self.history_path.exists():
+                self.history_path.unlink()
         except Exception as exc:
             messagebox.showerror("Reset Failed", f"Could not remove state file:\n{exc}")
             return
         self._load_data()
         messagebox.showinfo("State Reset", "Saved grading state was reset.")
 
-    def _export_csv(self):
+    def _refresh_scores(self):
         self._persist_current_form(mark_graded=False)
         self._ensure_grade_defaults()
-        self._recalculate_all_scores()
-        self._save_state()
-        out_path = self.export_path
+        # Only records touched since the last export need rescoring, unless the full score moved.
+        if self.export_scores_stale:
+            self._recalculate_all_scores()
+        else:
+            self._recalculate_scores([self.student_by_netid[n] for n in self.export_dirty if n in self.student_by_netid])
+        if self.export_scores_stale or self.export_dirty:
+            self._save_state()
+        self.export_scores_stale = False
+        self.export_dirty = set()
+        self.saved_records = {}
+
+    def _sync_lms(self):
+        if not self.lms_url:
+            messagebox.showerror("LMS sync", "Set QUIZ_GRADER_LMS_URL to the grade endpoint first.")
+            return
+        if self.lms_sync_running:
+            messagebox.showinfo("LMS sync", "A sync is already in progress.")
+            return
+        self._refresh_scores()
+        rows = lms_grade_rows(self.students, self.grades, self.lms_key_var.get())
+        url, token, path = self.lms_url, self.lms_token, self.lms_sync_state_path
+
+        def work(progress):
+            sync_state = load_lms_sync_state(path, url)
+            client = LmsClient(url, token=token)
+            try:
+                sent = sync_lms_grades(client, rows, sync_state, progress=progress)
+            finally:
+                client.close()
+                # Batches already accepted stay recorded even if a later one failed.
+                _write_json_cache(path, sync_state)
+            return sent, client.requests
+
+        def done(result):
+            self.lms_sync_running = False
+            sent, requests = result
+            self.export_status_var.set(f"LMS sync: {sent} of {len(rows)} grades sent in {requests} requests")
+
+        def failed(exc):
+            self.lms_sync_running = False
+            self.export_status_var.set(f"LMS sync failed: {exc}")
+            messagebox.showerror("LMS sync", str(exc))
+
+        self.lms_sync_running = True
+        self.export_status_var.set("Syncing grades to LMS...")
+        self._run_in_background(
+            work, done, on_progress=lambda i, n: self.export_status_var.set(f"LMS sync {i}/{n}..."), on_error=failed
+        )
+
+    def _export_csv(self):
+        if self.export_running:
+            messagebox.showinfo("Export running", "An export is already in progress.")
+            return
+        self._refresh_scores()
+
+        rows = []
+        for s in self.students:
+            rec = self._get_record(s.netid, create=True)
+            # Defensive normalization: mapped students with a submission should never export as missing.
+            if s.submission and rec.status_code is RecordStatus.MISSING:
+                rec.status_code = RecordStatus.UNGRADED
+                rec.graded = False
+                rec.score = None
+                self._record_changed(s.netid)
+            status, rubrics, score = _record_fields(rec)
+            rows.append(
+                (
+                    s.netid,
+                    s.first,
+                    s.last,
+                    s.email,
+                    s.submission,
+                    status,
+                    score,
+                    rubrics,
+                    rec.extra_deduction,
+                    rec.comments,
+                )
+            )
+        rubric_names = [(i.get("name", "") or "").strip() for i in self.rubric_items]
+        targets = {
+            "grades": self.export_path,
+            "lms": self.lms_export_path,
+            "matrix": self.matrix_export_path,
+        }
+        lms_key = self.lms_key_var.get()
+
+        def done(count):
+            self.export_running = False
+            self.export_status_var.set(f"Exported {count} rows: " + ", ".join(p.name for p in targets.values()))
+
+        def failed(exc):
+            self.export_running = False
+            self.export_status_var.set(f"Export failed: {exc}")
+            messagebox.showerror("Export failed", str(exc))
+
+        self.export_running = True
+        self.export_status_var.set("Exporting...")
+        self._run_in_background(
+            lambda progress: self._write_grade_exports(rows, rubric_names, targets, lms_key, progress),
+            done,
+            on_progress=lambda i, n: self.export_status_var.set(f"Exporting {i}/{n}..."),
+            on_error=failed,
+        )
+
+    def _write_grade_exports(self, rows, rubric_names, targets, lms_key, progress):
         fieldnames = [
             "Net ID",
             "First Name",
@@ -1053,42 +3643,1116 @@ class QuizGraderApp:
             "Extra Deduction",
             "Comments",
         ]
-        with out_path.open("w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            for s in self.students:
-                rec = self._get_record(s["netid"], create=True)
-                # Defensive normalization: mapped students with a submission should never export as missing.
-                if s.get("submission") and rec.get("status") == "missing":
-                    rec["status"] = "ungraded"
-                    rec["graded"] = False
-                    rec["score"] = None
-                score = rec.get("score")
-                if rec.get("status") == "missing":
-                    score = 0.0
-                elif rec.get("status") != "graded":
-                    score = None
-                writer.writerow(
-                    {
-                        "Net ID": s["netid"],
-                        "First Name": s["first"],
-                        "Last Name": s["last"],
-                        "Email": s["email"],
-                        "Submission File": Path(s["submission"]).name if s["submission"] else "",
-                        "Status": rec.get("status", "ungraded"),
-                        "Score": "" if score is None else self._fmt(float(score)),
-                        "Selected Rubrics": "; ".join(rec.get("selected_rubrics", [])),
-                        "Extra Deduction": self._fmt(self._safe_float(rec.get("extra_deduction", 0.0), 0.0)),
-                        "Comments": rec.get("comments", ""),
-                    }
+        tmp_paths = {k: Path(str(p) + ".tmp") for k, p in targets.items()}
+        try:
+            with tmp_paths["grades"].open("w", newline="", encoding="utf-8") as grades_f, tmp_paths["lms"].open(
+                "w", newline="", encoding="utf-8"
+            ) as lms_f, tmp_paths["matrix"].open("w", newline="", encoding="utf-8") as matrix_f:
+                grades_w = csv.writer(grades_f)
+                lms_w = csv.writer(lms_f)
+                matrix_w = csv.writer(matrix_f)
+                grades_w.writerow(fieldnames)
+                lms_w.writerow([lms_key, "Grade"])
+                matrix_w.writerow(["Net ID", "Status", "Score"] + rubric_names + ["Extra Deduction"])
+                for i, (netid, first, last, email, submission, status, score, selected, extra, comments) in enumerate(
+                    rows, 1
+                ):
+                    if status == "missing":
+                        score = 0.0
+                    elif status != "graded":
+                        score = None
+                    score_text = "" if score is None else self._fmt(float(score))
+                    extra_text = self._fmt(self._safe_float(extra, 0.0))
+                    grades_w.writerow(
+                        [
+                            netid,
+                            first,
+                            last,
+                            email,
+                            os.path.basename(submission) if submission else "",
+                            status,
+                            score_text,
+                            "; ".join(selected),
+                            extra_text,
+                            comments,
+                        ]
+                    )
+                    lms_w.writerow([email if lms_key == "Email" else netid, score_text])
+                    chosen = set(selected)
+                    matrix_w.writerow(
+                        [netid, status, score_text] + [1 if n in chosen else 0 for n in rubric_names] + [extra_text]
+                    )
+                    if i % 200 == 0 or i == len(rows):
+                        progress(i, len(rows))
+            for key, tmp in tmp_paths.items():
+                os.replace(tmp, targets[key])
+        finally:
+            for tmp in tmp_paths.values():
+                if tmp.exists():
+                    tmp.unlink()
+        return len(rows)
+
+    def _run_in_background(self, work, on_done, on_progress=None, on_error=None):
+        events = queue.Queue()
+
+        def runner():
+            try:
+                result = work(lambda *args: events.put(("progress", args)))
+            except Exception as exc:
+                events.put(("error", exc))
+            else:
+                events.put(("done", result))
+
+        def poll():
+            try:
+                while True:
+                    kind, payload = events.get_nowait()
+                    if kind == "progress":
+                        if on_progress:
+                            on_progress(*payload)
+                    elif kind == "error":
+                        if on_error:
+                            on_error(payload)
+                        else:
+                            messagebox.showerror("Background task failed", str(payload))
+                        return
+                    else:
+                        on_done(payload)
+                        return
+            except queue.Empty:
+                self.root.after(50, poll)
+
+        threading.Thread(target=runner, daemon=True).start()
+        self.root.after(50, poll)
+
+    def _compute_answer_clusters(self, submissions, page_index, top, bottom, max_distance, progress):
+        cache = _read_json_cache(self.cluster_cache_path)
+        file_hashes = cache.get("files", {})
+        fingerprints = cache.get("fingerprints", {})
+
+        keys = {}
+        for netid, path in submissions.items():
+            digest = _cached_file_sha1(path, file_hashes)
+            keys[netid] = f"{digest}:{page_index}:{top:.4f}:{bottom:.4f}"
+
+        todo = {}
+        for netid, key in keys.items():
+            if key not in fingerprints and key not in todo:
+                todo[key] = (submissions[netid], page_index, top, bottom)
+        task_keys = list(todo)
+        results = _process_pool_map(_answer_fingerprint, [todo[k] for k in task_keys], progress=progress)
+        fingerprints.update(zip(task_keys, results))
+
+        _write_json_cache(self.cluster_cache_path, {"files": file_hashes, "fingerprints": fingerprints})
+        clusters = _cluster_answer_fingerprints({n: fingerprints[k] for n, k in keys.items()}, max_distance)
+        return clusters, len(task_keys)
+
+    def _open_cluster_dialog(self):
+        if not _ensure_pdf_libs():
+            messagebox.showerror("Unavailable", "Answer clustering needs pymupdf + pillow.")
+            return
+        win = tk.Toplevel(self.root)
+        win.title("Answer Clusters")
+        win.geometry("620x460")
+
+        page_var = tk.StringVar(value="1")
+        top_var = tk.StringVar(value="0")
+        bottom_var = tk.StringVar(value="100")
+        distance_var = tk.StringVar(value="6")
+        status_var = tk.StringVar(value="Pick the page and vertical band (%) holding the answer.")
+
+        form = ttk.Frame(win, padding=8)
+        form.pack(fill=tk.X)
+        for label, var in (("Page", page_var), ("Top %", top_var), ("Bottom %", bottom_var), ("Max distance", distance_var)):
+            ttk.Label(form, text=label).pack(side=tk.LEFT)
+            ttk.Entry(form, textvariable=var, width=6).pack(side=tk.LEFT, padx=(4, 10))
+        compute_btn = ttk.Button(form, text="Compute")
+        compute_btn.pack(side=tk.LEFT)
+
+        ttk.Label(win, textvariable=status_var, padding=(8, 0)).pack(anchor="w")
+        listbox = tk.Listbox(win, height=14)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=8, pady=6)
+
+        actions = ttk.Frame(win, padding=(8, 0, 8, 8))
+        actions.pack(fill=tk.X)
+        # The clusters listed here and the quiz they were computed for; a quiz switch must not retarget them.
+        shown = {"quiz": self.quiz_name, "clusters": list(self.answer_clusters)}
+
+        def selected_cluster():
+            if shown["quiz"] != self.quiz_name:
+                messagebox.showerror(
+                    "Different quiz", f"These clusters belong to {shown['quiz']}; compute them again.", parent=win
                 )
-        messagebox.showinfo("Export complete", f"Wrote:\n{out_path}")
+                return None
+            sel = listbox.curselection()
+            if not sel or sel[0] >= len(shown["clusters"]):
+                messagebox.showerror("Missing selection", "Pick a cluster first.", parent=win)
+                return None
+            return shown["clusters"][sel[0]]
+
+        def show_clusters(result, quiz_name):
+            clusters, computed = result
+            self._publish_scan_result(quiz_name, {"answer_clusters": clusters})
+            if not win.winfo_exists():
+                return
+            shown["quiz"], shown["clusters"] = quiz_name, clusters
+            listbox.delete(0, tk.END)
+            for c in clusters:
+                preview = c["value"][:60] if c["kind"] == "text" else c["value"]
+                listbox.insert(tk.END, f"({len(c['members'])}) {c['kind']}: {preview}")
+            status_var.set(f"{len(clusters)} clusters, {computed} newly fingerprinted")
+            compute_btn.state(["!disabled"])
+
+        def compute():
+            page = int(self._safe_float(page_var.get(), 1)) - 1
+            top = min(1.0, max(0.0, self._safe_float(top_var.get(), 0.0) / 100.0))
+            bottom = min(1.0, max(0.0, self._safe_float(bottom_var.get(), 100.0) / 100.0))
+            if page < 0 or bottom <= top:
+                messagebox.showerror("Invalid region", "Page must be >= 1 and bottom must exceed top.", parent=win)
+                return
+            distance = int(self._safe_float(distance_var.get(), 6))
+            self._persist_current_form(mark_graded=False)
+            submissions = dict(self.submissions)
+            quiz_name = self.quiz_name
+            compute_btn.state(["disabled"])
+            status_var.set(f"Fingerprinting {len(submissions)} submissions...")
+
+            def progress_label(done, total):
+                if win.winfo_exists():
+                    status_var.set(f"Fingerprinting {done}/{total}...")
+
+            def failed(exc):
+                if win.winfo_exists():
+                    compute_btn.state(["!disabled"])
+                    status_var.set(f"Clustering failed: {exc}")
+
+            self._run_in_background(
+                lambda progress: self._compute_answer_clusters(submissions, page, top, bottom, distance, progress),
+                lambda result: show_clusters(result, quiz_name),
+                on_progress=progress_label,
+                on_error=failed,
+            )
+
+        def jump_to_cluster():
+            cluster = selected_cluster()
+            if cluster is None:
+                return
+            self._jump_to_netid(cluster["members"][0])
+
+        def apply_to_cluster():
+            cluster = selected_cluster()
+            if cluster is None or self._blocked_while_loading():
+                return
+            if cluster["kind"] in ("error", "nopage"):
+                # These group every PDF that failed to render or is too short, not students with the same answer.
+                messagebox.showerror(
+                    "Not an answer cluster", "This group holds unreadable or short PDFs; grade them one by one.", parent=win
+                )
+                return
+            members = cluster["members"]
+            if not messagebox.askyesno(
+                "Apply to Cluster",
+                f"Apply the current rubric selection and extra deduction to {len(members)} students and mark them graded?",
+                parent=win,
+            ):
+                return
+            changed = self._apply_current_form_to(members)
+            status_var.set(f"Applied current rubric selection to {changed} students")
+
+        compute_btn.configure(command=compute)
+        ttk.Button(actions, text="Jump to First", command=jump_to_cluster).pack(side=tk.LEFT)
+        ttk.Button(actions, text="Apply Current Form to Cluster", command=apply_to_cluster).pack(side=tk.LEFT, padx=6)
+
+    def _bulk_filter(self, status=None, has_all=(), has_none=(), min_score=None, max_score=None, comment=None):
+        matches = self.grade_index.query(
+            status=status,
+            has_all=has_all,
+            has_none=has_none,
+            min_score=min_score,
+            max_score=max_score,
+            comment=comment,
+        )
+        return sorted(n for n in matches if n in self.student_by_netid)
+
+    def _bulk_apply(self, netids, add=(), remove=(), extra_deduction=None):
+        started = time.perf_counter()
+        self._persist_current_form(mark_graded=False)
+        changed = []
+        befores = {}
+        for netid in netids:
+            student = self.student_by_netid.get(netid)
+            if not student or not student.get("submission"):
+                continue
+            rec = self._get_record(netid, create=True)
+            befores[netid] = _record_snapshot(rec)
+            before = (list(rec.get("selected_rubrics", [])), rec.get("extra_deduction", 0.0))
+            selected = [x for x in before[0] if x not in remove]
+            selected += [x for x in add if x not in selected]
+            rec["selected_rubrics"] = selected
+            if extra_deduction is not None:
+                rec["extra_deduction"] = extra_deduction
+            if (selected, rec.get("extra_deduction", 0.0)) != before:
+                changed.append(netid)
+
+        for netid in changed:
+            rec = self.grades[netid]
+            score, total_deduction, extra = self._compute_score_from_values(
+                rec["selected_rubrics"], rec.get("extra_deduction", 0.0)
+            )
+            rec["total_deduction"] = total_deduction
+            rec["extra_deduction"] = extra
+            rec["score"] = score if rec.get("status") == "graded" else None
+            self._record_changed(netid)
+
+        if changed:
+            self._push_record_history({n: befores[n] for n in changed}, focus=self._current_student()["netid"])
+            self._show_current_student()
+            self._save_state()
+        return len(changed), time.perf_counter() - started
+
+    def _open_bulk_dialog(self):
+        win = tk.Toplevel(self.root)
+        win.title("Bulk Edit")
+        win.geometry("560x360")
+
+        rubric_names = [""] + [(i.get("name", "") or "").strip() for i in self.rubric_items]
+        status_var = tk.StringVar(value="")
+        has_var = tk.StringVar(value="")
+        lacks_var = tk.StringVar(value="")
+        min_var = tk.StringVar(value="")
+        max_var = tk.StringVar(value="")
+        comment_var = tk.StringVar(value="")
+        add_var = tk.StringVar(value="")
+        remove_var = tk.StringVar(value="")
+        extra_var = tk.StringVar(value="")
+        result_var = tk.StringVar(value="Set filters, then Preview or Apply.")
+
+        filters = ttk.LabelFrame(win, text="Filter", padding=8)
+        filters.pack(fill=tk.X, padx=8, pady=(8, 0))
+        actions = ttk.LabelFrame(win, text="Change", padding=8)
+        actions.pack(fill=tk.X, padx=8, pady=(8, 0))
+
+        def row(parent, r, label, widget):
+            ttk.Label(parent, text=label).grid(row=r, column=0, sticky="w")
+            widget.grid(row=r, column=1, sticky="we", padx=6, pady=1)
+            parent.columnconfigure(1, weight=1)
+
+        row(filters, 0, "Status", ttk.Combobox(filters, textvariable=status_var, state="readonly",
+                                               values=["", "graded", "ungraded", "missing"]))
+        row(filters, 1, "Has rubric", ttk.Combobox(filters, textvariable=has_var, state="readonly", values=rubric_names))
+        row(filters, 2, "Lacks rubric", ttk.Combobox(filters, textvariable=lacks_var, state="readonly", values=rubric_names))
+        scores = ttk.Frame(filters)
+        ttk.Entry(scores, textvariable=min_var, width=8).pack(side=tk.LEFT)
+        ttk.Label(scores, text=" to ").pack(side=tk.LEFT)
+        ttk.Entry(scores, textvariable=max_var, width=8).pack(side=tk.LEFT)
+        row(filters, 3, "Score range", scores)
+        row(filters, 4, "Comment contains", ttk.Entry(filters, textvariable=comment_var))
+
+        row(actions, 0, "Add rubric", ttk.Combobox(actions, textvariable=add_var, state="readonly", values=rubric_names))
+        row(actions, 1, "Remove rubric", ttk.Combobox(actions, textvariable=remove_var, state="readonly", values=rubric_names))
+        row(actions, 2, "Set extra deduction", ttk.Entry(actions, textvariable=extra_var, width=8))
+
+        def matches():
+            return self._bulk_filter(
+                status=status_var.get() or None,
+                has_all=[has_var.get()] if has_var.get() else [],
+                has_none=[lacks_var.get()] if lacks_var.get() else [],
+                min_score=self._safe_float(min_var.get(), None) if min_var.get().strip() else None,
+                max_score=self._safe_float(max_var.get(), None) if max_var.get().strip() else None,
+                comment=comment_var.get().strip() or None,
+            )
+
+        def preview():
+            result_var.set(f"{len(matches())} students match")
+
+        def apply():
+            netids = matches()
+            extra = None
+            if extra_var.get().strip():
+                extra = self._safe_float(extra_var.get(), None)
+                if extra is None:
+                    messagebox.showerror("Invalid value", "Extra deduction must be a number.", parent=win)
+                    return
+            add = [add_var.get()] if add_var.get() else []
+            remove = [remove_var.get()] if remove_var.get() else []
+            if not add and not remove and extra is None:
+                messagebox.showerror("Nothing to change", "Pick a rubric change or an extra deduction.", parent=win)
+                return
+            if self._blocked_while_loading():
+                return
+            if not messagebox.askyesno("Bulk Edit", f"Apply changes to {len(netids)} matching students?", parent=win):
+                return
+            changed, elapsed = self._bulk_apply(netids, add=add, remove=remove, extra_deduction=extra)
+            result_var.set(f"Changed {changed} of {len(netids)} records in {elapsed * 1000:.0f} ms")
+
+        buttons = ttk.Frame(win, padding=8)
+        buttons.pack(fill=tk.X)
+        ttk.Button(buttons, text="Preview", command=preview).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Apply", command=apply).pack(side=tk.LEFT, padx=6)
+        ttk.Label(buttons, textvariable=result_var).pack(side=tk.LEFT, padx=6)
+
+    def _submission_paths(self):
+        submissions_dir = Path(self.submissions_path_var.get()).expanduser()
+        return sorted(set(self.submissions.values()) | {str(submissions_dir / n) for n in self.unmatched_files})
+
+    def _staged_sources(self, paths):
+        if self.stage_cache is None:
+            return {}
+        return {p: local for p in paths if (local := self.stage_cache.lookup(p))}
+
+    def _start_submission_scans(self):
+        # Staging, file check, duplicate scan and text index run one after another over a single
+        # worker pool; running them at once had three pools contending for the same share.
+        paths = self._submission_paths()
+        quiz_name = self.quiz_name
+        token = object()
+        self._scans_token = token
+        self.scans_complete = False
+        pool = _process_pool()
+        passes = [self._start_integrity_check, self._start_duplicate_scan, self._start_text_index]
+        self.problems_var.set("File check: waiting...")
+        self.duplicates_var.set("Duplicates: waiting...")
+
+        def run(i=0):
+            if i == len(passes) or self._scans_token is not token:
+                pool.shutdown(wait=False)
+                if i == len(passes):
+                    self._publish_scan_result(quiz_name, {"scans_complete": True})
+                return
+            passes[i](paths, pool, lambda: run(i + 1))
+
+        if self.stage_cache is not None:
+            self._start_staging(run)
+        else:
+            run()
+
+    def _start_integrity_check(self, paths, pool, then):
+        cache_path = self.check_cache_path
+        quiz_name = self.quiz_name
+
+        def work(progress):
+            cache = _read_json_cache(cache_path)
+            sources = self._staged_sources(paths)
+            problems = check_submissions(paths, cache, progress=progress, pool=pool, sources=sources)
+            _write_json_cache(cache_path, cache)
+            return problems
+
+        def label(text):
+            self._publish_scan_result(quiz_name, {}, {"problems_var": text})
+
+        def done(problems):
+            text = f"File check: {len(problems)} problem files" if problems else "File check: all OK"
+            if self._publish_scan_result(quiz_name, {"problem_files": problems}, {"problems_var": text}) and problems:
+                self._open_problem_files_dialog()
+            then()
+
+        def failed(exc):
+            label(f"File check: failed ({exc})")
+            then()
+
+        label("File check: running...")
+        self._run_in_background(
+            work, done, on_progress=lambda i, n: label(f"File check: {i}/{n}..."), on_error=failed
+        )
+
+    def _open_problem_files_dialog(self):
+        win = tk.Toplevel(self.root)
+        win.title("Problem Submissions")
+        win.geometry("640x320")
+        listbox = tk.Listbox(win)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        rows = sorted(self.problem_files, key=lambda p: (self._duplicate_owner(p), p))
+        for path in rows:
+            listbox.insert(tk.END, f"{self._duplicate_owner(path)}  |  {Path(path).name}  |  {self.problem_files[path]}")
+        if not rows:
+            listbox.insert(tk.END, "All submissions open and render.")
+
+        def open_selected():
+            sel = listbox.curselection()
+            if not sel or sel[0] >= len(rows):
+                return
+            owner = self._duplicate_owner(rows[sel[0]])
+            if owner == "unmatched" or not self._jump_to_netid(owner):
+                self.unmatched_preview_path = rows[sel[0]]
+                self._load_embedded_pdf_for_current()
+
+        ttk.Button(win, text="Go to Selected", command=open_selected).pack(anchor="w", padx=8, pady=(0, 8))
+
+    def _start_duplicate_scan(self, paths, pool, then):
+        cache_path = self.fingerprint_cache_path
+        quiz_name = self.quiz_name
+
+        def work(progress):
+            cache = _read_json_cache(cache_path)
+            sources = self._staged_sources(paths)
+            fingerprints = fingerprint_submissions(paths, cache, progress=progress, pool=pool, sources=sources)
+            _write_json_cache(cache_path, cache)
+            return find_duplicate_submissions(fingerprints)
+
+        def label(text):
+            self._publish_scan_result(quiz_name, {}, {"duplicates_var": text})
+
+        def done(groups):
+            exact = sum(1 for g in groups if g["kind"] == "exact")
+            text = f"Duplicates: {exact} exact, {len(groups) - exact} near" if groups else "Duplicates: none"
+            self._publish_scan_result(quiz_name, {"duplicate_groups": groups}, {"duplicates_var": text})
+            then()
+
+        def failed(exc):
+            label(f"Duplicates: failed ({exc})")
+            then()
+
+        label("Duplicates: checking...")
+        self._run_in_background(
+            work, done, on_progress=lambda i, n: label(f"Duplicates: hashing {i}/{n}..."), on_error=failed
+        )
+
+    def _start_text_index(self, paths, pool, then):
+        index_path = self.text_index_path
+        previous = self.text_index
+        quiz_name = self.quiz_name
+        run = object()
+        self._text_index_runs[quiz_name] = run
+
+        def work(progress):
+            if not _ensure_pdf_libs():
+                return None
+            # The live index is never mutated after it is swapped in, so copying it here is safe.
+            index = previous.copy() if previous.files else TextIndex.from_dict(_read_json_cache(index_path))
+            sources = self._staged_sources(paths)
+            changed = index_submission_text(set(paths), index, progress=progress, pool=pool, sources=sources)
+            if changed or not index_path.exists():
+                _write_json_cache(index_path, index.to_dict())
+            return index, changed
+
+        def done(result):
+            if result is None:
+                self.export_status_var.set("Text index: install pymupdf")
+            elif self._text_index_runs.get(quiz_name) is run:
+                index, changed = result
+                if self._publish_scan_result(quiz_name, {"text_index": index, "text_index_ready": True}):
+                    self.export_status_var.set(f"Text index: {len(index.files)} PDFs ({changed} re-indexed)")
+            then()
+
+        def failed(exc):
+            self.export_status_var.set(f"Text index failed: {exc}")
+            then()
+
+        # Each run indexes its own copy and swaps it in from done(); queries keep the previous index meanwhile.
+        self._run_in_background(
+            work,
+            done,
+            on_progress=lambda i, n: self.export_status_var.set(f"Indexing text {i}/{n}..."),
+            on_error=failed,
+        )
+
+    def _start_staging(self, then):
+        # Grading order from the current student onward, then unmatched files for mapping.
+        ordered = self.students[self.current_index :] + self.students[: self.current_index]
+        submissions_dir = Path(self.submissions_path_var.get()).expanduser()
+        paths = [s["submission"] for s in ordered if s.get("submission")]
+        paths += [str(submissions_dir / n) for n in self.unmatched_files]
+        cache = self.stage_cache
+
+        def done(result):
+            staged, copied = result
+            self.export_status_var.set(f"Staged {staged} PDFs locally ({copied} copied)")
+            then()
+
+        def failed(exc):
+            self.export_status_var.set(f"Staging failed: {exc}")
+            then()
+
+        self._run_in_background(
+            lambda progress: cache.stage(paths, progress=progress),
+            done,
+            on_progress=lambda i, n: self.export_status_var.set(f"Staging PDFs {i}/{n}..."),
+            on_error=failed,
+        )
+
+    def _open_text_search(self):
+        win = tk.Toplevel(self.root)
+        win.title("Search Submission Text")
+        win.geometry("620x400")
+        query_var = tk.StringVar()
+        page_var = tk.StringVar()
+        status_var = tk.StringVar(value="Type words to find pages that contain all of them.")
+        rows = []
+
+        form = ttk.Frame(win, padding=8)
+        form.pack(fill=tk.X)
+        ttk.Label(form, text="Words").pack(side=tk.LEFT)
+        query_entry = ttk.Entry(form, textvariable=query_var, width=36)
+        query_entry.pack(side=tk.LEFT, padx=6)
+        ttk.Label(form, text="Page").pack(side=tk.LEFT)
+        ttk.Entry(form, textvariable=page_var, width=5).pack(side=tk.LEFT, padx=6)
+        listbox = tk.Listbox(win)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=8)
+        ttk.Label(win, textvariable=status_var).pack(anchor="w", padx=8, pady=(4, 8))
+
+        def run_query(*_args):
+            if not self.text_index_ready:
+                status_var.set("Text index is still building...")
+                return
+            page = page_var.get().strip()
+            started = time.perf_counter()
+            hits = self.text_index.query(query_var.get(), page=int(page) if page.isdigit() else None)
+            elapsed = (time.perf_counter() - started) * 1000
+            owners = {p: n for n, p in self.submissions.items()}
+            listbox.delete(0, tk.END)
+            rows.clear()
+            for path in sorted(hits, key=lambda p: self.student_positions.get(owners.get(p), len(self.students))):
+                netid = owners.get(path)
+                s = self.student_by_netid.get(netid)
+                who = f"{netid} | {s['last']}, {s['first']}" if s else f"unmatched | {Path(path).name}"
+                listbox.insert(tk.END, f"{who} | p. {', '.join(str(p) for p in hits[path])}")
+                rows.append((path, netid, hits[path][0]))
+            status_var.set(f"{len(rows)} submissions in {elapsed:.1f} ms")
+
+        def open_selected(_event=None):
+            sel = listbox.curselection()
+            if not sel:
+                return
+            path, netid, page = rows[sel[0]]
+            if netid is None or not self._jump_to_netid(netid):
+                self._persist_current_form(mark_graded=False)
+                self.unmatched_preview_path = path
+                self._load_embedded_pdf_for_current()
+            self._scroll_to_page(page - 1)
+
+        query_var.trace_add("write", run_query)
+        page_var.trace_add("write", run_query)
+        listbox.bind("<Double-Button-1>", open_selected)
+        listbox.bind("<Return>", open_selected)
+        query_entry.focus_set()
+
+    def _duplicate_owner(self, path):
+        owner = next((netid for netid, p in self.submissions.items() if p == path), None)
+        return owner or "unmatched"
+
+    def _open_duplicates_dialog(self):
+        win = tk.Toplevel(self.root)
+        win.title("Duplicate Submissions")
+        win.geometry("560x360")
+        listbox = tk.Listbox(win)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        rows = []
+        for group in self.duplicate_groups:
+            listbox.insert(tk.END, f"{group['kind'].upper()} ({len(group['paths'])} files)")
+            rows.append(None)
+            for path in group["paths"]:
+                listbox.insert(tk.END, f"    {Path(path).name}  ->  {self._duplicate_owner(path)}")
+                rows.append(path)
+        if not rows:
+            listbox.insert(tk.END, "No duplicates found.")
+
+        def preview():
+            sel = listbox.curselection()
+            path = rows[sel[0]] if sel and sel[0] < len(rows) else None
+            if not path:
+                return
+            self.unmatched_preview_path = path
+            self._load_embedded_pdf_for_current()
+
+        ttk.Button(win, text="Preview Selected", command=preview).pack(anchor="w", padx=8, pady=(0, 8))
+
+    def _open_split_dialog(self):
+        if not _ensure_pdf_libs():
+            messagebox.showerror("Unavailable", "Splitting scans needs pymupdf + pillow.")
+            return
+        scan = filedialog.askopenfilename(
+            title="Batch scan to split", filetypes=[("PDF", "*.pdf")], initialdir=str(self.base_dir)
+        )
+        if not scan:
+            return
+        win = tk.Toplevel(self.root)
+        win.title("Split Batch Scan")
+        mode_var = tk.StringVar(value="fixed")
+        pages_var = tk.StringVar(value="2")
+        status_var = tk.StringVar(value=Path(scan).name)
+
+        form = ttk.Frame(win, padding=8)
+        form.pack(fill=tk.X)
+        ttk.Label(form, text="Split by").grid(row=0, column=0, sticky="w")
+        ttk.Combobox(form, textvariable=mode_var, state="readonly", values=["fixed", "blank", "cover"], width=10).grid(
+            row=0, column=1, sticky="w", padx=6
+        )
+        ttk.Label(form, text="Pages each (fixed)").grid(row=1, column=0, sticky="w")
+        ttk.Entry(form, textvariable=pages_var, width=6).grid(row=1, column=1, sticky="w", padx=6)
+        ttk.Label(
+            form, text="blank: blank sheets separate submissions; cover: pages matching page 1 start one"
+        ).grid(row=2, column=0, columnspan=2, sticky="w", pady=(4, 0))
+        ttk.Label(win, textvariable=status_var, padding=(8, 0)).pack(anchor="w")
+        split_btn = ttk.Button(win, text="Split into Submissions Folder")
+        split_btn.pack(anchor="w", padx=8, pady=8)
+
+        def done(result):
+            names, prefix = result
+            new = [n for n in names if n not in self.unmatched_files]
+            self.unmatched_files.extend(new)
+            self._refresh_mapping_controls()
+            if new:
+                self.unmatched_choice_var.set(new[0])
+            text = f"Wrote {len(names)} PDFs; added to unmatched mapping list"
+            if prefix != Path(scan).stem:
+                text += f" (named {prefix}_*.pdf: {Path(scan).stem}_*.pdf already exist)"
+            status_var.set(text)
+            split_btn.state(["!disabled"])
+
+        def split():
+            mode = mode_var.get()
+            pages_per = int(self._safe_float(pages_var.get(), 0))
+            if mode == "fixed" and pages_per < 1:
+                messagebox.showerror("Invalid value", "Pages each must be at least 1.", parent=win)
+                return
+            out_dir = Path(self.submissions_path_var.get()).expanduser()
+            split_btn.state(["disabled"])
+            status_var.set("Splitting...")
+            def failed(exc):
+                split_btn.state(["!disabled"])
+                status_var.set(f"Split failed: {exc}")
+
+            self._run_in_background(
+                lambda progress: split_scan(scan, out_dir, mode=mode, pages_per=pages_per, progress=progress),
+                done,
+                on_progress=lambda i, n: status_var.set(f"Splitting {i}/{n}..."),
+                on_error=failed,
+            )
+
+        split_btn.configure(command=split)
+
+    def _open_stats_panel(self):
+        if self.stats_text is not None:
+            self.stats_text.winfo_toplevel().lift()
+            return
+        win = tk.Toplevel(self.root)
+        win.title("Grading Statistics")
+        win.geometry("520x560")
+        self.stats_text = tk.Text(win, wrap="none", font=("TkFixedFont", 10))
+        self.stats_text.pack(fill=tk.BOTH, expand=True)
+
+        def closed():
+            self.stats_text = None
+            win.destroy()
+
+        win.protocol("WM_DELETE_WINDOW", closed)
+        self._refresh_stats_panel()
+
+    def _schedule_stats_refresh(self):
+        # Coalesce bursts of record changes (typing, bulk edits) into one redraw.
+        if self.stats_text is None or self._stats_refresh_id is not None:
+            return
+        self._stats_refresh_id = self.root.after(500, self._refresh_stats_panel)
+
+    def _refresh_stats_panel(self):
+        self._stats_refresh_id = None
+        if self.stats_text is None:
+            return
+        names = [(i.get("name", "") or "").strip() for i in self.rubric_items]
+        self.stats_text.configure(state="normal")
+        self.stats_text.delete("1.0", tk.END)
+        self.stats_text.insert("1.0", "\n".join(self.grade_stats.report_lines(names)))
+        self.stats_text.configure(state="disabled")
+
+    def _generate_feedback(self):
+        if not _ensure_pdf_libs():
+            messagebox.showerror("Unavailable", "Feedback PDFs need pymupdf + pillow.")
+            return
+        self._persist_current_form(mark_graded=False)
+        # Snapshot so the worker never reads records the UI thread is editing.
+        students = [dict(s) for s in self.students]
+        state = json.loads(json.dumps(self._state_payload()))
+        out_dir = self.feedback_dir
+
+        def done(result):
+            written, skipped, failed = result
+            text = f"Feedback PDFs: {written} written, {skipped} unchanged in {out_dir.name}/"
+            if failed:
+                text += f", {len(failed)} failed"
+                lines = [f"{netid}: {error}" for netid, error in sorted(failed.items())]
+                if len(lines) > 20:
+                    lines = lines[:20] + [f"... and {len(lines) - 20} more"]
+                messagebox.showerror("Feedback PDFs", "Could not write feedback for:\n" + "\n".join(lines))
+            self.export_status_var.set(text)
+
+        def failed(exc):
+            self.export_status_var.set(f"Feedback PDFs failed: {exc}")
+
+        self.export_status_var.set("Generating feedback PDFs...")
+        self._run_in_background(
+            lambda progress: generate_feedback_pdfs(students, state, out_dir, progress=progress),
+            done,
+            on_progress=lambda i, n: self.export_status_var.set(f"Feedback PDFs {i}/{n}..."),
+            on_error=failed,
+        )
+
+    def _jump_to_netid(self, netid):
+        i = self.student_positions.get(netid)
+        if i is None:
+            return False
+        self._persist_current_form(mark_graded=False)
+        self.unmatched_preview_path = None
+        self.current_index = i
+        self._show_current_student()
+        return True
+
+    def _update_search_results(self):
+        if self.search_results is None:
+            return
+        self.search_matches = self.search_index.search(self.search_var.get(), limit=8)
+        self.search_results.delete(0, tk.END)
+        if not self.search_matches:
+            self.search_results.pack_forget()
+            return
+        for netid in self.search_matches:
+            s = self.student_by_netid.get(netid)
+            label = f"{netid} | {s['last']}, {s['first']} | {s['email']}" if s else netid
+            self.search_results.insert(tk.END, label)
+        self.search_results.selection_clear(0, tk.END)
+        self.search_results.selection_set(0)
+        self.search_results.pack(fill=tk.X, pady=(0, 4), after=self.search_row)
+
+    def _focus_search_results(self):
+        if self.search_matches:
+            self.search_results.focus_set()
+            self.search_results.activate(0)
+
+    def _jump_to_search_result(self, position):
+        if position is None:
+            sel = self.search_results.curselection()
+            position = sel[0] if sel else 0
+        if position >= len(self.search_matches):
+            return
+        if self._jump_to_netid(self.search_matches[position]):
+            self.search_var.set("")
+
+    def _apply_current_form_to(self, netids):
+        if not self.students:
+            return 0
+        self._persist_current_form(mark_graded=False)
+        _, _, selected, extra = self._compute_score_for_current()
+        changed = 0
+        befores = {}
+        for netid in netids:
+            student = self.student_by_netid.get(netid)
+            if not student or not student.get("submission"):
+                continue
+            rec = self._get_record(netid, create=True)
+            befores[netid] = _record_snapshot(rec)
+            score, total_deduction, extra_value = self._compute_score_from_values(selected, extra)
+            rec["selected_rubrics"] = list(selected)
+            rec["extra_deduction"] = extra_value
+            rec["total_deduction"] = total_deduction
+            if rec.get("status") != "graded":
+                rec["graded_at"] = time.time()
+            rec["graded"] = True
+            rec["status"] = "graded"
+            rec["score"] = score
+            self._record_changed(netid)
+            changed += 1
+        self._push_record_history(befores, focus=self._current_student()["netid"])
+        self._show_current_student()
+        self._save_state()
+        return changed
+
+
+def _run_feedback_command(args):
+    if not _ensure_pdf_libs():
+        raise SystemExit("Feedback PDFs need pymupdf + pillow.")
+    state = read_state(args.state)
+    students = read_roster(args.roster)
+    match_submissions(students, args.submissions, state.get("manual_mappings", {}) or {})
+    written, skipped, failed = generate_feedback_pdfs(
+        students, state, args.out, progress=lambda i, n: print(f"\r{i}/{n}", end="", flush=True)
+    )
+    print(f"\nWrote {written} feedback PDFs, {skipped} unchanged, in {args.out}")
+    for netid, error in sorted(failed.items()):
+        print(f"failed: {netid}: {error}", file=sys.stderr)
+    if failed:
+        raise SystemExit(1)
+
+
+def _run_split_command(args):
+    if not _ensure_pdf_libs():
+        raise SystemExit("Splitting scans needs pymupdf + pillow.")
+    if args.mode == "fixed" and not args.pages:
+        raise SystemExit("--pages is required with --mode fixed")
+    started = time.perf_counter()
+    names, prefix = split_scan(
+        args.scan,
+        args.out,
+        mode=args.mode,
+        pages_per=args.pages,
+        progress=lambda i, n: print(f"\r{i}/{n}", end="", flush=True),
+    )
+    print(f"\nWrote {len(names)} PDFs to {args.out} in {time.perf_counter() - started:.1f}s")
+    if prefix != Path(args.scan).stem:
+        print(f"{Path(args.scan).stem}_*.pdf already exist in {args.out}; named these {prefix}_*.pdf")
+
+
+def _run_shard_command(args):
+    graders = [g.strip() for g in args.graders.split(",") if g.strip()]
+    if not graders:
+        raise SystemExit("--graders needs at least one grader id")
+    state = read_state(args.state)
+    students = read_roster(args.roster)
+    match_submissions(students, args.submissions, state.get("manual_mappings", {}) or {})
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for grader, shard in shard_state(state, students, graders).items():
+        path = out_dir / f"grading_state.{grader}.json"
+        with path.open("w", encoding="utf-8") as f:
+            json.dump(shard, f, indent=2)
+        print(f"{path}: {len(shard['assignment']['netids'])} students")
+
+
+def _run_merge_command(args):
+    started = time.perf_counter()
+    merged, conflicts = merge_states(args.inputs)
+    out_path = Path(args.out)
+    tmp = Path(str(out_path) + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=2)
+    os.replace(tmp, out_path)
+    for line in conflicts:
+        print(f"conflict: {line}")
+    print(
+        f"Merged {len(args.inputs)} files into {out_path}: {len(merged['grades'])} records, "
+        f"{len(merged['rubric_items'])} rubric items, {len(conflicts)} conflicts in {time.perf_counter() - started:.2f}s"
+    )
+
+
+def _synthetic_grades(n, rubric_names, seed=0):
+    rng = random.Random(seed)
+    grades = {}
+    for i in range(n):
+        status = rng.choice(_STATUS_NAMES)
+        selected = [x for x in rubric_names if rng.random() < 0.25] if status == "graded" else []
+        grades[f"s{i:06d}"] = {
+            "selected_rubrics": selected,
+            "extra_deduction": 0.0,
+            "comments": "",
+            "graded": status != "ungraded",
+            "status": status,
+            "score": 10.0 - len(selected) if status == "graded" else (0.0 if status == "missing" else None),
+            "total_deduction": float(len(selected)),
+            "graded_at": None,
+            "updated_at": None,
+            "grader": "",
+        }
+    return grades
+
+
+def _best_time(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
 
 
-def main():
+def benchmark_records(n, rubric_count):
+    import tracemalloc
+
+    names = [f"R{i}" for i in range(rubric_count)]
+    text = json.dumps(_synthetic_grades(n, names))
+
+    tracemalloc.start()
+    plain = json.loads(text)
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    registry = RubricRegistry(names)
+    compact = {netid: GradeRecord.from_dict(rec, registry) for netid, rec in json.loads(text).items()}
+    compact_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    target = names[len(names) // 2]
+
+    def get_lookup(grades):
+        # The dict-style access that dialogs and older code paths still use.
+        return lambda: sum(
+            1 for rec in grades.values() if rec.get("status") == "graded" and target in rec.get("selected_rubrics", [])
+        )
+
+    def rebuild(grades):
+        # What every load does through _record_changed: refill the grade index and statistics.
+        def run():
+            index, stats = GradeIndex(), GradeStats()
+            for netid, rec in grades.items():
+                index.update(netid, rec)
+                stats.update(netid, rec)
+
+        return run
+
+    assert get_lookup(plain)() == get_lookup(compact)()
+    identical = json.dumps({netid: rec.to_dict() for netid, rec in compact.items()}) == text
+    lines = [
+        f"{n} records, {rubric_count} rubric items",
+        f"memory: dict {dict_bytes / 1e6:.2f} MB, compact {compact_bytes / 1e6:.2f} MB ({dict_bytes / max(compact_bytes, 1):.1f}x)",
+    ]
+    for label, make in (("rec.get status+rubric", get_lookup), ("index+stats rebuild", rebuild)):
+        dict_s = _best_time(make(plain))
+        compact_s = _best_time(make(compact))
+        lines.append(
+            f"{label}: dict {dict_s * 1000:.2f} ms, compact {compact_s * 1000:.2f} ms "
+            f"(compact/dict {compact_s / max(dict_s, 1e-9):.2f})"
+        )
+    lines.append(f"JSON round trip identical: {identical}")
+    return lines
+
+
+def _run_bench_records_command(args):
+    print("\n".join(benchmark_records(args.records, args.rubrics)))
+
+
+def _run_sync_command(args):
+    if not args.url:
+        raise SystemExit("--url (or QUIZ_GRADER_LMS_URL) is required")
+    state = read_state(args.state)
+    rows = lms_grade_rows(read_roster(args.roster), state.get("grades", {}) or {}, args.key)
+    sync_state = load_lms_sync_state(args.sync_state, args.url)
+    client = LmsClient(args.url, token=args.token, max_rps=args.max_rps)
+    started = time.perf_counter()
+    try:
+        sent = sync_lms_grades(client, rows, sync_state, batch_size=args.batch_size)
+    finally:
+        client.close()
+        _write_json_cache(Path(args.sync_state), sync_state)
+    print(
+        f"Sent {sent} of {len(rows)} grades in {client.requests} requests "
+        f"({time.perf_counter() - started:.2f}s)"
+    )
+
+
+def _run_serve_lms_command(args):
+    server = serve_mock_lms(args.port, fail_rate=args.fail_rate)
+    print(f"Mock LMS listening on http://127.0.0.1:{server.server_address[1]}/grades", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _run_check_command(args):
+    paths = sorted(str(p) for p in Path(args.submissions).glob("*.pdf"))
+    cache_path = Path(args.cache)
+    cache = _read_json_cache(cache_path)
+    started = time.perf_counter()
+    problems = check_submissions(paths, cache, progress=None)
+    _write_json_cache(cache_path, cache)
+    for path in sorted(problems):
+        print(f"{Path(path).name}: {problems[path]}")
+    print(f"Checked {len(paths)} PDFs in {time.perf_counter() - started:.2f}s: {len(problems)} problem files")
+    if problems:
+        raise SystemExit(1)
+
+
+def _run_report_command(args):
+    state = read_state(args.state)
+    students = read_roster(args.roster)
+    grades = state.get("grades", {}) or {}
+    stats = GradeStats()
+    for s in students:
+        rec = grades.get(s["netid"])
+        stats.update(s["netid"], rec if isinstance(rec, dict) else None, s.get("section", ""))
+    names = [(i.get("name", "") or "").strip() for i in state.get("rubric_items", []) or []]
+    print("\n".join(stats.report_lines(names)))
+
+
+def main(argv=None):
+    cwd = Path.cwd()
+    parser = argparse.ArgumentParser(description="Lightweight quiz grader.")
+    commands = parser.add_subparsers(dest="command")
+
+    feedback = commands.add_parser("feedback", help="write a feedback PDF per graded student")
+    feedback.add_argument("--roster", default=str(cwd / "roster.csv"))
+    feedback.add_argument("--submissions", default=str(cwd / "Quiz1"))
+    feedback.add_argument("--state", default=str(cwd / "grading_state.json"))
+    feedback.add_argument("--out", default=str(cwd / "feedback"))
+    feedback.set_defaults(run=_run_feedback_command)
+
+    split = commands.add_parser("split", help="split one bulk scan into per-submission PDFs")
+    split.add_argument("scan")
+    split.add_argument("--out", default=str(cwd / "Quiz1"))
+    split.add_argument("--mode", choices=["fixed", "blank", "cover"], default="fixed")
+    split.add_argument("--pages", type=int, help="pages per submission (fixed mode)")
+    split.set_defaults(run=_run_split_command)
+
+    shard = commands.add_parser("shard", help="split students with submissions into per-grader state files")
+    shard.add_argument("--graders", required=True, help="comma-separated grader ids")
+    shard.add_argument("--roster", default=str(cwd / "roster.csv"))
+    shard.add_argument("--submissions", default=str(cwd / "Quiz1"))
+    shard.add_argument("--state", default=str(cwd / "grading_state.json"))
+    shard.add_argument("--out", default=str(cwd / "shards"))
+    shard.set_defaults(run=_run_shard_command)
+
+    merge = commands.add_parser("merge", help="merge grading state files from several machines")
+    merge.add_argument("out", help="merged state file to write")
+    merge.add_argument("inputs", nargs="+", help="state files to merge")
+    merge.set_defaults(run=_run_merge_command)
+
+    report = commands.add_parser("report", help="print grading statistics from the saved state")
+    report.add_argument("--roster", default=str(cwd / "roster.csv"))
+    report.add_argument("--state", default=str(cwd / "grading_state.json"))
+    report.set_defaults(run=_run_report_command)
+
+    check = commands.add_parser("check", help="report corrupt, encrypted, empty or non-PDF submissions")
+    check.add_argument("--submissions", default=str(cwd / "Quiz1"))
+    check.add_argument("--cache", default=str(cwd / "submission_checks.json"))
+    check.set_defaults(run=_run_check_command)
+
+    sync = commands.add_parser("sync", help="push changed grades to an LMS endpoint in batches")
+    sync.add_argument("--url", default=os.environ.get("QUIZ_GRADER_LMS_URL"))
+    sync.add_argument("--token", default=os.environ.get("QUIZ_GRADER_LMS_TOKEN"))
+    sync.add_argument("--roster", default=str(cwd / "roster.csv"))
+    sync.add_argument("--state", default=str(cwd / "grading_state.json"))
+    sync.add_argument("--sync-state", default=str(cwd / "lms_sync_state.json"))
+    sync.add_argument("--key", choices=["Email", "Net ID"], default="Email")
+    sync.add_argument("--batch-size", type=int, default=LMS_BATCH_SIZE)
+    sync.add_argument("--max-rps", type=float, default=LMS_MAX_RPS)
+    sync.set_defaults(run=_run_sync_command)
+
+    serve_lms = commands.add_parser("serve-lms", help="run a local stand-in LMS grade endpoint for testing sync")
+    serve_lms.add_argument("--port", type=int, default=8765)
+    serve_lms.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered 429/503")
+    serve_lms.set_defaults(run=_run_serve_lms_command)
+
+    bench = commands.add_parser("bench-records", help="compare dict and compact grade record memory/lookup cost")
+    bench.add_argument("--records", type=int, default=50000)
+    bench.add_argument("--rubrics", type=int, default=12)
+    bench.set_defaults(run=_run_bench_records_command)
+
+    parser.add_argument(
+        "--startup-check",
+        action="store_true",
+        help=f"open the app, report cold-start time and exit non-zero if over {STARTUP_TARGET_MS} ms",
+    )
+
+    args = parser.parse_args(argv)
+    if args.command:
+        args.run(args)
+        return
+
     root = tk.Tk()
-    QuizGraderApp(root)
+    app = QuizGraderApp(root)
+    if args.startup_check:
+
+        def report():
+            loaded = "failed" if app.startup_ms is None else f"{app.startup_ms:.0f} ms"
+            print(f"window interactive: {app.window_ready_ms:.0f} ms, data loaded: {loaded}")
+            root.destroy()
+
+        app.on_ready = report
     root.mainloop()
+    if args.startup_check and (
+        app.window_ready_ms is None or app.window_ready_ms > STARTUP_TARGET_MS or app.startup_ms is None
+    ):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
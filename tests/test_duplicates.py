@@ -0,0 +1,62 @@
+import random
+
+from quiz_grader_app import INK_GRID, find_duplicate_submissions
+
+WIDTH, HEIGHT = INK_GRID
+TOTAL = WIDTH * HEIGHT
+
+
+def _cells(rows, cols):
+    bits = 0
+    for r in rows:
+        for c in cols:
+            bits |= 1 << (TOTAL - 1 - (r * WIDTH + c))
+    return bits
+
+
+# Printed question boxes shared by every copy of the quiz.
+TEMPLATE = _cells(range(10, 12), range(4, 60)) | _cells(range(40, 42), range(4, 60)) | _cells(range(4, 76), [4, 59])
+PAGE_HASH = "ab" * 32
+
+
+def _fingerprint(sha1, *ink):
+    bits = TEMPLATE
+    for extra in ink:
+        bits |= extra
+    return {"sha1": sha1, "pages": [PAGE_HASH], "ink": [f"{bits:0{TOTAL // 4}x}"]}
+
+
+def _scribble(rng, count=60):
+    bits = 0
+    for _ in range(count):
+        bits |= _cells([rng.randrange(14, 38)], [rng.randrange(6, 58)])
+    return bits
+
+
+def _near(groups):
+    return [g["paths"] for g in groups if g["kind"] == "near"]
+
+
+def test_name_line_only_differences_are_not_near_duplicates():
+    fps = {f"s{n}.pdf": _fingerprint(f"sha{n}", _cells([2], range(6, 6 + n % 40))) for n in range(30)}
+    assert _near(find_duplicate_submissions(fps)) == []
+
+
+def test_template_with_different_answers_is_not_near_duplicate():
+    rng = random.Random(7)
+    fps = {f"s{n}.pdf": _fingerprint(f"sha{n}", _scribble(rng)) for n in range(20)}
+    assert _near(find_duplicate_submissions(fps)) == []
+
+
+def test_copied_answers_on_the_template_are_near_duplicates():
+    rng = random.Random(3)
+    fps = {f"s{n}.pdf": _fingerprint(f"sha{n}", _scribble(rng)) for n in range(10)}
+    answers = _scribble(rng)
+    fps["copy_a.pdf"] = _fingerprint("a", answers, _cells([2], range(6, 12)))
+    fps["copy_b.pdf"] = _fingerprint("b", answers, _cells([2], range(6, 18)))
+    assert _near(find_duplicate_submissions(fps)) == [["copy_a.pdf", "copy_b.pdf"]]
+
+
+def test_exact_copies_are_grouped_by_file_hash():
+    fps = {"a.pdf": _fingerprint("same"), "b.pdf": _fingerprint("same"), "c.pdf": _fingerprint("other")}
+    assert find_duplicate_submissions(fps)[0] == {"kind": "exact", "paths": ["a.pdf", "b.pdf"]}
@@ -0,0 +1,57 @@
+import json
+
+from quiz_grader_app import merge_states
+
+
+def _write(path, state):
+    path.write_text(json.dumps(state), encoding="utf-8")
+    return path
+
+
+def _graded(selected, updated_at, grader):
+    return {"selected_rubrics": selected, "extra_deduction": 0, "status": "graded", "updated_at": updated_at, "grader": grader}
+
+
+def test_rename_then_reuse_name_keeps_both_rubrics(tmp_path):
+    state = {
+        "full_score": 10,
+        "rubric_items": [{"name": "Y", "points": 1, "updated_at": 100.0}, {"name": "X", "points": 3, "updated_at": 200.0}],
+        "rubric_renames": [{"old": "X", "new": "Y", "at": 100.0}],
+        "grades": {"s1": _graded(["Y", "X"], 300.0, "ann")},
+    }
+    merged, conflicts = merge_states([_write(tmp_path / "a.json", state)])
+    assert [i["name"] for i in merged["rubric_items"]] == ["Y", "X"]
+    assert merged["grades"]["s1"]["selected_rubrics"] == ["Y", "X"]
+    assert merged["grades"]["s1"]["score"] == 6.0
+    assert conflicts == []
+
+
+def test_rename_applies_to_shards_that_did_not_see_it(tmp_path):
+    ann = {
+        "full_score": 10,
+        "rubric_items": [{"name": "Y", "points": 1, "updated_at": 100.0}, {"name": "X", "points": 3, "updated_at": 200.0}],
+        "rubric_renames": [{"old": "X", "new": "Y", "at": 100.0}],
+        "grades": {"s1": _graded(["X"], 300.0, "ann")},
+    }
+    bob = {
+        "full_score": 10,
+        "rubric_items": [{"name": "X", "points": 1, "updated_at": 50.0}],
+        "grades": {"s2": _graded(["X"], 150.0, "bob")},
+    }
+    merged, conflicts = merge_states([_write(tmp_path / "a.json", ann), _write(tmp_path / "b.json", bob)])
+    assert sorted(i["name"] for i in merged["rubric_items"]) == ["X", "Y"]
+    assert merged["grades"]["s1"]["selected_rubrics"] == ["X"]
+    assert merged["grades"]["s2"]["selected_rubrics"] == ["Y"]
+    assert conflicts == []
+
+
+def test_conflicting_renames_fold_into_the_latest(tmp_path):
+    base = {"full_score": 10, "grades": {}}
+    ann = dict(base, rubric_items=[{"name": "Y", "points": 1}], rubric_renames=[{"old": "X", "new": "Y", "at": 1.0}])
+    bob = dict(base, rubric_items=[{"name": "Z", "points": 1}], rubric_renames=[{"old": "X", "new": "Z", "at": 2.0}])
+    bob["grades"] = {"s1": _graded(["Z"], 5.0, "bob")}
+    ann["grades"] = {"s2": _graded(["Y"], 5.0, "ann")}
+    merged, conflicts = merge_states([_write(tmp_path / "a.json", ann), _write(tmp_path / "b.json", bob)])
+    assert [i["name"] for i in merged["rubric_items"]] == ["Z"]
+    assert merged["grades"]["s2"]["selected_rubrics"] == ["Z"]
+    assert len(conflicts) == 1
@@ -0,0 +1,23 @@
+import json
+
+from quiz_grader_app import GradeRecord, RubricRegistry, UndoHistory
+
+
+def test_selected_rubrics_follow_rubric_list_order():
+    registry = RubricRegistry(["A", "B"])
+    rec = GradeRecord.from_dict({"selected_rubrics": ["B", "C", "A"]}, registry)
+    assert rec["selected_rubrics"] == ["A", "B", "C"]
+    registry.set_order(["C", "B", "A"])
+    assert rec["selected_rubrics"] == ["C", "B", "A"]
+    assert rec.to_dict()["selected_rubrics"] == ["C", "B", "A"]
+
+
+def test_history_is_trimmed_by_size_oldest_first():
+    history = UndoHistory()
+    for i in range(10):
+        history.push({"op": "records", "focus": f"s{i}", "changes": {f"s{i}": ({"comments": "x" * 1000}, {})}})
+    history.trim(max_bytes=3500)
+    assert [op["focus"] for op in history.undo_stack] == ["s7", "s8", "s9"]
+    history.trim(max_bytes=10)
+    assert [op["focus"] for op in history.undo_stack] == ["s9"]
+    assert len(json.dumps(history.to_dict())) < 4 * 1024 * 1024